@@ -0,0 +1,227 @@
+'''
+Catalog of the finished output files under a data root.
+
+Checking the existence of tens of thousands of deep paths on a parallel file
+system takes minutes, so the writers record their finished products in an
+append-only manifest ({root}/manifest.jsonl) and the skip checks become
+dictionary lookups after one read of the manifest.
+- a record is one json line: path (relative to root), size, mtime, meta
+- appends are single writes, so concurrent writers do not interleave
+- a recorded path exists without touching the disk, so the manifest is not
+  told about files deleted or rewritten by hand, verify it to drop them
+  (one stat per record):
+    python manifest.py verify {root}
+- until the manifest is complete, a path missing from it costs one
+  os.path.exists, the file is adopted if found so the files written before
+  the manifest existed are still skipped. after a rebuild (complete) a miss
+  is trusted, and files added by hand are not seen until the next rebuild:
+    python manifest.py rebuild {root} [--pattern '*.nc']
+
+----
+manifest = get_manifest(dataDir)
+if manifest.exists(path): return
+... write path ...
+manifest.record(path, variable='olr')
+'''
+import argparse
+import fnmatch
+import json
+import time
+import os
+
+
+_manifests = {}
+
+
+def get_manifest(root):
+    '''
+    return the shared manifest of the data root
+    '''
+    root = os.path.abspath(root)
+    if root not in _manifests:
+        _manifests[root] = Manifest(root)
+    return _manifests[root]
+
+
+class Manifest():
+    fileName = 'manifest.jsonl'
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.path = f'{self.root}/{self.fileName}'
+        self.records = None # relative path -> record, loaded on first use
+        self.complete = False # all the files on disk are recorded, set by rebuild
+
+
+    def exists(self, path):
+        key = self._get_key(path)
+        if key in self._get_records():
+            return True
+
+        if self.complete:
+            return False
+
+        # not recorded yet, adopt the file if it was written without the manifest
+        if os.path.exists(path):
+            self.record(path, adopted=True)
+            return True
+        return False
+
+
+    def get(self, path):
+        return self._get_records().get(self._get_key(path))
+
+
+    def record(self, path, **meta):
+        '''
+        record a finished product, call it after the file is completely written
+        '''
+        stat = os.stat(path)
+        record = {
+            'path': self._get_key(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'recorded': time.time(),
+            'meta': meta,
+        }
+        self._append(record)
+        self._get_records()[record['path']] = record
+
+
+    def forget(self, path):
+        key = self._get_key(path)
+        self._append({'path': key, 'removed': True})
+        self._get_records().pop(key, None)
+
+
+    def verify(self):
+        '''
+        forget the records whose files are deleted or rewritten (size or mtime) since
+        they were recorded, return the forgotten paths
+        '''
+        changed = []
+        for key, record in list(self._get_records().items()):
+            path = f'{self.root}/{key}'
+            if not _is_unchanged(path, record):
+                self.forget(path)
+                changed.append(path)
+        return changed
+
+
+    def rebuild(self, pattern='*.nc'):
+        '''
+        rewrite the manifest from the files on disk that match pattern
+        '''
+        records = {}
+        for path in _walk(self.root):
+            if not fnmatch.fnmatch(os.path.basename(path), pattern):
+                continue
+            if '.tmp.' in os.path.basename(path): # partial writes
+                continue
+            stat = os.stat(path)
+            key = self._get_key(path)
+            old = self._get_records().get(key, {})
+            records[key] = {
+                'path': key,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'recorded': time.time(),
+                'meta': old.get('meta', {'rebuilt': True}),
+            }
+
+        tmpPath = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmpPath, 'w') as f:
+            f.write(json.dumps({'complete': True}) + '\n')
+            for record in records.values():
+                f.write(json.dumps(record, default=_to_json) + '\n')
+        os.replace(tmpPath, self.path)
+        self.records = records
+        self.complete = True
+        return records
+
+
+    def _get_key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+
+    def _get_records(self):
+        if self.records is None:
+            self.records = self._load()
+        return self.records
+
+
+    def _load(self):
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path) as f:
+            for iLine, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f'[warning] skipping the broken line {iLine+1} of {self.path}')
+                    continue
+                if record.get('complete'):
+                    self.complete = True
+                elif record.get('removed'):
+                    records.pop(record['path'], None)
+                else:
+                    records[record['path']] = record
+        return records
+
+
+    def _append(self, record):
+        os.makedirs(self.root, exist_ok=True)
+        line = (json.dumps(record, default=_to_json) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o664)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def _is_unchanged(path, record):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return stat.st_size == record['size'] and stat.st_mtime == record['mtime']
+
+
+def _to_json(value):
+    # numpy scalars and arrays in meta
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def _walk(root):
+    for entry in os.scandir(root):
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk(entry.path)
+        elif entry.is_file():
+            yield entry.path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='the catalog of the output files')
+    parser.add_argument('command', choices=['rebuild', 'verify', 'list'])
+    parser.add_argument('root', help='the data root of the manifest')
+    parser.add_argument('--pattern', default='*.nc', help='file names to catalog when rebuilding')
+    args = parser.parse_args()
+
+    manifest = get_manifest(args.root)
+    if args.command == 'rebuild':
+        records = manifest.rebuild(args.pattern)
+        print(f'{len(records)} files are recorded in {manifest.path}')
+    elif args.command == 'verify':
+        for path in manifest.verify():
+            print(f'forgotten (deleted or rewritten): {path}')
+    elif args.command == 'list':
+        for key in sorted(manifest._get_records()):
+            print(key)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+from obs_cache import get_obs_cache, make_key
 import pytools as pyt 
 import copy
 from matplotlib import pyplot as plt
@@ -8,7 +9,7 @@ import os
 
 
 class Plotter():
-    def __init__(self, cases, plot_set, data_dir, fig_dir_root):
+    def __init__(self, cases, plot_set, data_dir, fig_dir_root, dtype='float64'):
         matplotlib.use('Agg') # don't start interactive plots
         from .subdriver import Option_Shading
         from .subdriver import Option_Vector
@@ -20,6 +21,8 @@ class Plotter():
         self.plot_set = plot_set
         self.data_dir = data_dir
         self.figs = plot_set.figs
+        self.dtype = np.dtype(dtype)
+        self.obs_cache = get_obs_cache(f'{data_dir}/cache/obs')
 
         self.Option_Shading = Option_Shading
         self.Option_Vector = Option_Vector
@@ -392,16 +395,30 @@ class Plotter():
             ]
             minMaxs = [obsTimeRange, *plot_type.minMaxs[1:]]
             
+            def read():
+                if plot_type.total_anomaly == 'anomaly':
+                    return pyt.rt.obsReader.anomaly(
+                        variable, minMaxs, plot_type.obs_source,
+                        climYears=plot_type.obs_clim_yr, root=obs_data_dir
+                    )
+                else:
+                    return pyt.rt.obsReader.total(
+                        plot_type.variable, minMaxs, plot_type.obs_source,
+                    )
+
+            # shared with the other plot types/modules, copy since operators work in place
             if plot_type.total_anomaly == 'anomaly':
-                data, dims = pyt.rt.obsReader.anomaly(
-                    variable, minMaxs, plot_type.obs_source,
-                    climYears=plot_type.obs_clim_yr, root=obs_data_dir
+                key = make_key(
+                    'anomaly', variable, plot_type.obs_source,
+                    climYears=plot_type.obs_clim_yr, grid=(obs_data_dir, str(minMaxs[1:])),
                 )
-
             else:
-                data, dims = pyt.rt.obsReader.total(
-                    plot_type.variable, minMaxs, plot_type.obs_source,
+                key = make_key(
+                    'total', plot_type.variable, plot_type.obs_source,
+                    grid=(obs_data_dir, str(minMaxs[1:])),
                 )
+            data, dims = self.obs_cache.get(key, obsTimeRange, read, copy=True)
+            data = data.astype(self.dtype, copy=False)
             dims[0] = [t - dims[0][0] for t in dims[0]] # from time to lead
             return data, dims
 
@@ -432,7 +449,7 @@ class Plotter():
             if len(minMaxs) == 4: # Pa -> hPa
                 dims[-3] /= 100
 
-            data = np.squeeze(data, axis=(0, 1))
+            data = np.squeeze(data, axis=(0, 1)).astype(self.dtype, copy=False)
             return data, dims
 
         datas = []
@@ -17,13 +17,13 @@ def run(cases, dataDir, figDir, option):
     for i, plot_set in enumerate(option.plot_sets):
         wrapped_func = greeter(_run_plot_set, '', f'-{i}/{n}')
         try:
-            wrapped_func(plot_set, cases, dataDir, figDir)
+            wrapped_func(plot_set, cases, dataDir, figDir, option.dtype)
         except Exception:
             print(traceback.format_exc())
 
 
-def _run_plot_set(plot_set, cases, dataDir, figDir):
-    plotter = _Plotter.Plotter(cases, plot_set, dataDir, figDir)
+def _run_plot_set(plot_set, cases, dataDir, figDir, dtype):
+    plotter = _Plotter.Plotter(cases, plot_set, dataDir, figDir, dtype)
     plotter.run()
 
 
@@ -31,6 +31,7 @@ def _run_plot_set(plot_set, cases, dataDir, figDir):
 class Option(): # defalt options
     numCases: int 
     plot_sets: list[dict] = None
+    dtype: str = 'float64' # 'float32' to halve the memory
 
     def __post_init__(self):
         # default settings
@@ -42,6 +43,9 @@ class Option(): # defalt options
         # type checking
         pyt.chkt.checkType(self.numCases, int , 'numCases')
         pyt.chkt.checkType(self.plot_sets, list, 'plot_sets')
+        pyt.chkt.checkType(self.dtype, str, 'dtype')
+        if self.dtype not in ['float32', 'float64']:
+            raise ValueError(f'dtype must be float32 or float64, {self.dtype=}')
         for plot_set in self.plot_sets:
             pyt.chkt.checkType(plot_set, dict, 'elements in plot_set')
 
@@ -1 +1 @@
-/nwpr/gfs/com120/0_tools/MJO/RMM_WH04/RMM_Tool.py
\ No newline at end of file
+../../../../standalone_modules/mjo/rmm/RMM_Tool.py
\ No newline at end of file
@@ -3,6 +3,7 @@
     calculate the RMM indices from the mermean data
 '''
 from .RMM_Tool import RMM_Tool
+from .rmm_store import open_mermean, open_rmm
 import pytools as pyt
 import numpy as np
 import os
@@ -45,156 +46,157 @@ def run(modelName, initTimes, members, dataDir, clim_bc=False):
         raise PermissionError(f'denied to write to {desRoot}')
 
 
-    def get_path(initTime, member):
-        path = pyt.tt.float2format(
-            initTime,
-            f'{desRoot}/%Y/E{member:03d}/%y%m%d_RMM.nc'
-        )
-        return path
-
-    def get_desPath(initTime, member):
-        desPath = get_path(initTime, member)
-        desDir = os.path.dirname(desPath)
-
-        if not os.path.exists(desDir):
-            os.system(f'mkdir -p {desDir}')
-
-        if not pyt.ft.canBeWritten(desPath):
-            raise PermissionError(f'{desPath}')
-
-        return desPath
-
-    def save(desPath, time, pc1, pc2):
-        for varName, data in zip(['pc1', 'pc2'], [pc1, pc2]):
-            pyt.nct.save(
-                desPath, {
-                    varName: data,
-                    'time': time,
-                },
-                overwrite=True
-            )
-
     #
     # --- core
-    def readcalsave(initTime, member):
-        fp.flush(f'running {pyt.tt.float2format(initTime, "%Y%m%d %Hz")}, member={member}')
-
-        desPath = get_desPath(initTime, member)
-        if os.path.exists(desPath):
-            fp.print(f'skip existing file {desPath}')
-            return
-
-        timeRangeObs = [initTime - numPrevDays, initTime - 1]
-
-
-        def modPathsExist():
-            paths = [
-                pyt.tt.float2format(
-                    initTime,
-                    f'{srcRootDirMod}/%Y/E{member:03d}/%y%m%d_{varName}.nc'
-                ) for varName in ['olr', 'u850', 'u200']
-            ]
-            if not all([os.path.exists(p) for p in paths]):
-                return False
-            else:
-                return True
-
-
-        def readObs(varName):
-            paths = [
-                pyt.tt.float2format(date, f'{srcRootDirObs}/%Y/%y%m%d_{varName}.nc')
-                for date in np.r_[timeRangeObs[0]:timeRangeObs[1]+1]
-            ]
-
-            data, _ = pyt.rt.multiNcRead.read(
-                paths, varName, [timeRangeObs, [None]*2], stackedAlong=0
+    obsHistory = {} # the projected obs of the whole run, read once for all inits and members
+
+    def getObsWindow(initTime):
+        '''
+        return the projected obs of the previous 120 days, (120, 2), a view of the history
+        '''
+        if not obsHistory:
+            timeRangeObs = [min(initTimes) - numPrevDays, max(initTimes) - 1]
+            fp.flush(
+                f'reading obs {pyt.tt.float2format(timeRangeObs[0])}'
+                f' - {pyt.tt.float2format(timeRangeObs[1])}'
             )
-            return data
-
-
-        def readMod(varName):
-            path = pyt.tt.float2format(
-                initTime,
-                f'{srcRootDirMod}/%Y/E{member:03d}/%y%m%d_{varName}.nc'
-            )
-            data = pyt.nct.read(path, varName)
-            return data
-
-
-        def read(varName):
-            mod = readMod(varName)
-            obs = readObs(varName)
-            return np.concatenate((obs, mod), axis=0)
-
-        if not modPathsExist():
-            print('skip because paths are missing')
-            return
-
-        olr = read('olr')
-        u850 = read('u850')
-        u200 = read('u200')
+            obs = []
+            obsHistory['filled'] = True
+            for varName in ['olr', 'u850', 'u200']:
+                with open_mermean(srcRootDirObs, varName, series=False, mode='r') as store:
+                    vals, filled = store.read(np.r_[timeRangeObs[0]:timeRangeObs[1]+1], varName, [0])
+                obs.append(vals[:, 0])
+                obsHistory['filled'] = obsHistory['filled'] & filled[:, 0]
+            obsHistory['time0'] = timeRangeObs[0]
+            obsHistory['pcs'] = rmm_tool.project(*obs) # the missing days are zeros
+
+        # the window is not valid if any of its days is missing
+        i0 = int(initTime - numPrevDays - obsHistory['time0'])
+        filled = obsHistory['filled'][i0:i0 + numPrevDays]
+        if filled.shape[0] != numPrevDays or not np.all(filled):
+            return None
+        return obsHistory['pcs'][i0:i0 + numPrevDays]
+
+    def readMod(initTime, member):
+        '''
+        return the model series of olr, u850, u200, (3, nt, 144)
+        '''
+        if not all([modStores[varName].has(initTime, member) for varName in modStores]):
+            print('skip because the mermean data are missing')
+            return None
+
+        mods = []
+        for varName, store in modStores.items():
+            vals, _ = store.read([initTime], varName, [member])
+            nt = store.read_lengths([initTime], [member])[0, 0]
+            mods.append(vals[0, 0, :nt])
 
         # remove extra time steps in u
-        nt = min([olr.shape[0], u200.shape[0], u850.shape[0]])
-        olr = olr[:nt, :]
-        u200 = u200[:nt, :]
-        u850 = u850[:nt, :]
+        nt = min([mod.shape[0] for mod in mods])
+        return np.stack([mod[:nt, :] for mod in mods])
+
+    def readcalsave(todo):
+        '''
+        read all the (initTime, member) of todo and project them in one call,
+        the obs part of the series is projected once in getObsWindow
+        '''
+        done, series = [], []
+        for initTime, member in todo:
+            fp.flush(f'reading {pyt.tt.float2format(initTime, "%Y%m%d %Hz")}, member={member}')
+
+            if rmmStore.has(initTime, member):
+                fp.print(f'skip existing member={member} in {rmmStore.path}')
+                continue
 
-        pc1, pc2 = rmm_tool.get_pcs(olr, u850, u200)
+            data = readMod(initTime, member)
+            if data is not None:
+                done.append((initTime, member))
+                series.append(data)
 
-        pc1 = pc1[numPrevDays:]
-        pc2 = pc2[numPrevDays:]
+        if not series:
+            return
 
-        time = [initTime + i + 1 for i in range(nt - numPrevDays)]
+        # pad the shorter series with nans (zeros in the projection), the
+        # 120-day mean only looks backward, so the valid steps are not affected
+        ntMax = max([data.shape[1] for data in series])
+        stack = np.full((len(series), 3, ntMax, 144), np.nan)
+        for data, out in zip(series, stack):
+            out[:, :data.shape[1], :] = data
+
+        fp.flush(f'projecting {len(series)} series')
+        modPcs = rmm_tool.project(stack[:, 0], stack[:, 1], stack[:, 2])
+        del stack
+
+        pcs = np.zeros((len(series), numPrevDays + ntMax, 2))
+        valid = np.ones(len(series), dtype=bool)
+        for i, (initTime, _) in enumerate(done):
+            obsWindow = getObsWindow(initTime)
+            if obsWindow is None:
+                fp.print(f'[warning] obs are not found in the previous {numPrevDays} days of {pyt.tt.float2format(initTime)}')
+                valid[i] = False
+                continue
+            pcs[i, :numPrevDays] = obsWindow
+        pcs[:, numPrevDays:] = modPcs
+        pc1s, pc2s = rmm_tool.pcs_from_projection(pcs)
 
-        save(desPath, time, pc1, pc2)
+        for (initTime, member), data, pc1, pc2, isValid in zip(done, series, pc1s, pc2s, valid):
+            if not isValid:
+                continue
+            nt = numPrevDays + data.shape[1]
+            rmmStore.write(initTime, member, {'pc1': pc1[numPrevDays:nt], 'pc2': pc2[numPrevDays:nt]})
         return
     
     def ensavg(initTime, member):
         fp.flush(f'running {pyt.tt.float2format(initTime, "%Y%m%d %Hz")}, member={member}')
         numMembers = -member
 
-        desPath = get_desPath(initTime, member)
-        if os.path.exists(desPath):
-            fp.print(f'skip existing file {desPath}')
+        if rmmStore.has(initTime, member):
+            fp.print(f'skip existing member={member} in {rmmStore.path}')
             return
 
-        srcPaths = []
-        for mem in range(numMembers):
-            path = get_path(initTime, mem)
-            if not os.path.exists(path):
-                fp.print(f'path not found: {path}')
-                continue
-            srcPaths.append(path)
+        lengths = rmmStore.read_lengths([initTime], range(numMembers))[0]
+        for mem in np.nonzero(lengths == 0)[0]:
+            fp.print(f'member not found: {mem}')
 
-        if not srcPaths:
-            fp.print(f'[fatal]: no valid srcpaths found')
+        if not np.any(lengths):
+            fp.print(f'[fatal]: no valid members found')
             return
 
-        pc1s = [pyt.nct.read(path, 'pc1') for path in srcPaths]
-        pc2s = [pyt.nct.read(path, 'pc2') for path in srcPaths]
+        # the members shorter than a lead are nans there
+        numLeads = max(lengths)
+        pcs = {}
+        for varName in ['pc1', 'pc2']:
+            vals, _ = rmmStore.read([initTime], varName, range(numMembers))
+            pcs[varName] = np.nanmean(vals[0, lengths > 0, :numLeads], axis=0)
 
-        numLeads = max((len(p) for p in pc1s))
-        time = [initTime + lead for lead in range(numLeads)]
-
-        pc1, pc2 = np.nan * np.ones(numLeads), np.nan * np.ones(numLeads)
-        for iLead in range(numLeads):
-            pc1[iLead] = np.mean([pc1[iLead] for pc1 in pc1s if len(pc1) > iLead])
-            pc2[iLead] = np.mean([pc2[iLead] for pc2 in pc2s if len(pc2) > iLead])
-
-        
-        save(desPath, time, pc1, pc2)
+        rmmStore.write(initTime, member, pcs)
         return
 
 
     #
-    # --- loop over the core
-    for initTime in initTimes:
-        for member in members:
-            if member > 0:
-                readcalsave(initTime, member)
-            else:
-                ensavg(initTime, member)
+    # --- loop over the core, the ensemble averages after all the members are saved
+    modStores = {}
+    try:
+        for varName in ['olr', 'u850', 'u200']:
+            modStores[varName] = open_mermean(srcRootDirMod, varName, series=True, mode='r')
+    except FileNotFoundError:
+        fp.print(f'skip {modelName}, mermean store not found in {srcRootDirMod}')
+        for store in modStores.values():
+            store.close()
+        return
+
+    rmmStore = open_rmm(desRoot, series=True)
+    try:
+        readcalsave([
+            (initTime, member) for initTime in initTimes for member in members if member > 0
+        ])
+        for initTime in initTimes:
+            for member in members:
+                if member <= 0:
+                    ensavg(initTime, member)
+    finally:
+        for store in [*modStores.values(), rmmStore]:
+            store.close()
 
     fp.print(f'< exiting {pyt.ft.getModuleName()}')
 
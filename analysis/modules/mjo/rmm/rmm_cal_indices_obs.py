@@ -3,6 +3,7 @@
     calculate the RMM indices from the mermean data
 '''
 from .RMM_Tool import RMM_Tool
+from .rmm_store import open_mermean, open_rmm
 import pytools as pyt
 import numpy as np
 import os
@@ -37,72 +38,45 @@ def run(dateStart, dateEnd, dataDir):
 
     #
     # --- core
-    def readcalsave(date):
-        fp.flush(f'running {pyt.tt.float2format(date)} ')
-        desPath = pyt.tt.float2format(date, f'{desRoot}/%Y/%y%m%d_RMM.nc')
-        desDir = os.path.dirname(desPath)
-
-        if not os.path.exists(desDir):
-            os.system(f'mkdir -p {desDir}')
+    history = {} # the mermean of all the dates and the previous 120 days, read once
 
-        if not pyt.ft.canBeWritten(desPath):
-            raise PermissionError(f'{desPath}')
+    def read(varName):
+        if varName not in history:
+            with open_mermean(srcRoot, varName, series=False, mode='r') as store:
+                vals, filled = store.read(np.r_[dates[0]-numPrevDays:dates[-1]+1], varName, [0])
+            history[varName] = (vals[:, 0], filled[:, 0])
+        return history[varName]
 
-        if os.path.exists(desPath):
-            fp.print(f'skip existing file {desPath}')
+    def readcalsave(store, iDate, date):
+        fp.flush(f'running {pyt.tt.float2format(date)} ')
+        if store.has(date):
+            fp.print(f'skip existing {pyt.tt.float2format(date)} in {store.path}')
             return
 
-        timeStart = date - 120
+        timeStart = date - numPrevDays
         timeEnd = date
 
-        def read(varName):
-            paths = [
-                pyt.tt.float2format(date, f'{srcRoot}/%Y/%y%m%d_{varName}.nc')
-                for date in np.r_[timeStart:timeEnd+1]
-            ]
-            for path in paths:
-                if not os.path.exists(path):
-                    fp.appendPrint(
-                        f'skip because file not found for reading {varName}' \
-                        + f' {"-".join([pyt.tt.float2format(d) for d in [timeStart, timeEnd]])}'
-                        + f' {path=}'
-                    )
-                    return None, None
-
-            data, dims = pyt.rt.multiNcRead.read(
-                paths, varName, [[timeStart, timeEnd], [None]*2], stackedAlong=0
-            )
-            return data, dims
-
-        olr, dims = read('olr')
-        if olr is None: return
-
-        u850, dims = read('u850')
-        if u850 is None: return
-
-        u200, dims = read('u200')
-        if u200 is None: return
-
-        pc1, pc2 = rmm_tool.get_pcs(olr, u850, u200)
-
-        pc1 = pc1[numPrevDays:]
-        pc2 = pc2[numPrevDays:]
-        time = dims[0][numPrevDays:]
-
-        for varName, data in zip(['pc1', 'pc2'], [pc1, pc2]):
-            pyt.nct.save(
-                desPath, {
-                    varName: data,
-                    'time': time,
-                },
-                overwrite=True
-            )
+        data = []
+        for varName in ['olr', 'u850', 'u200']:
+            vals, filled = read(varName)
+            window = slice(iDate, iDate + numPrevDays + 1)
+            if not np.all(filled[window]):
+                fp.appendPrint(
+                    f'skip because data not found for reading {varName}' \
+                    + f' {"-".join([pyt.tt.float2format(d) for d in [timeStart, timeEnd]])}'
+                )
+                return
+            data.append(vals[window])
+
+        pc1, pc2 = rmm_tool.get_pcs(*data)
+        store.write(date, 0, {'pc1': pc1[numPrevDays], 'pc2': pc2[numPrevDays]})
 
 
     #
     # --- loop over the core
-    for date in dates:
-        readcalsave(date)
+    with open_rmm(desRoot, series=False) as store:
+        for iDate, date in enumerate(dates):
+            readcalsave(store, iDate, date)
 
     fp.print(f'< exiting {pyt.ft.getModuleName()}')
 
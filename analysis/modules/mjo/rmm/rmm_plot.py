@@ -1,5 +1,6 @@
 from driver import Case
 from .rmmPhaseDiagram import phase_diagram
+from .rmm_store import open_rmm
 import pytools as pyt
 import matplotlib
 import matplotlib.pyplot as plt
@@ -42,41 +43,18 @@ class Rmm_plotter():
 
 
     def _read_indices(self):
-        # ---- obs
+        # ---- obs, aligned to the valid dates
         self.fp.flush('reading obs')
-        timeRange = [min(self.initTimes), max(self.initTimes) + self.numLeads]
-        paths = [
-            pyt.tt.float2format(
-                date,
-                f'{self.dataRoot}/obs/%Y/%y%m%d_RMM.nc',
-            )
-            for date in np.r_[timeRange[0]:timeRange[1]+1]
+        validDates = [
+            initTime + lead for initTime in self.initTimes for lead in range(self.numLeads)
         ]
-        paths = [p for i, p in enumerate(paths) if p not in paths[:i]]
-        pc1_obs, dims_obs = pyt.rt.multiNcRead.read(paths, 'pc1', [[None]*2], stackedAlong=0)
-        pc2_obs, dims_obs = pyt.rt.multiNcRead.read(paths, 'pc2', [[None]*2], stackedAlong=0)
-
-        # ---- align the obs to valid dates
-        pc1_valid = np.nan * np.ones((self.numInits, self.numLeads))
-        pc2_valid = np.nan * np.ones((self.numInits, self.numLeads))
-        date_obs = list(dims_obs[0])
-        for iInit, initTime in enumerate(self.initTimes):
-            validDates = [initTime + lead for lead in range(self.numLeads)]
-            iDates = [date_obs.index(vd) for vd in validDates]
-            pc1_valid[iInit, :] = pc1_obs[iDates]
-            pc2_valid[iInit, :] = pc2_obs[iDates]
+        with open_rmm(f'{self.dataRoot}/obs', series=False, mode='r') as store:
+            pc1_obs, _ = store.read(validDates, 'pc1', [0])
+            pc2_obs, _ = store.read(validDates, 'pc2', [0])
+        pc1_valid = pc1_obs.reshape(self.numInits, self.numLeads)
+        pc2_valid = pc2_obs.reshape(self.numInits, self.numLeads)
 
         # ---- model
-        def getModelPath(modelName, member, initTime, hasClim):
-            if hasClim:
-                nobc = ''
-            else:
-                nobc = '-noBC'
-            return pyt.tt.float2format(
-                initTime,
-                f'{self.dataRoot}/{modelName}{nobc}/%Y/E{member:03d}/%y%m%d_RMM.nc'
-            )
-
         # list[array]: [model][member, init, lead]
         pc1_cases = [None for __ in range(self.numCases)]
         pc2_cases = [None for __ in range(self.numCases)]
@@ -84,18 +62,25 @@ class Rmm_plotter():
             numMembers = case.model.numMembers
             pc1_cases[iCase] = np.nan * np.ones((numMembers, self.numInits, self.numLeads))
             pc2_cases[iCase] = np.nan * np.ones((numMembers, self.numInits, self.numLeads))
-            for iMember, member in enumerate(case.model.members):
-                for iInit, initTime in enumerate(self.initTimes):
-                    path = getModelPath(case.model.name, member, initTime, case.model.hasClim)
-                    if not os.path.exists(path):
-                        print(f'path not found {path}')
-                        continue
-                    pc1 = pyt.nct.read(path, 'pc1')
-                    pc2 = pyt.nct.read(path, 'pc2')
-
-                    nt = min([len(pc1), self.numLeads])
-                    pc1_cases[iCase][iMember, iInit, :nt] = pc1[:nt]
-                    pc2_cases[iCase][iMember, iInit, :nt] = pc2[:nt]
+
+            nobc = '' if case.model.hasClim else '-noBC'
+            srcRoot = f'{self.dataRoot}/{case.model.name}{nobc}'
+            try:
+                store = open_rmm(srcRoot, series=True, mode='r')
+            except FileNotFoundError:
+                print(f'store not found in {srcRoot}')
+                continue
+
+            with store:
+                members = case.model.members
+                for pcs, varName in zip([pc1_cases, pc2_cases], ['pc1', 'pc2']):
+                    vals, filled = store.read(self.initTimes, varName, members) # (init, member, lead)
+                    nt = min([vals.shape[-1], self.numLeads])
+                    pcs[iCase][:len(members), :, :nt] = vals[..., :nt].transpose(1, 0, 2)
+
+                for iInit, iMember in zip(*np.nonzero(~filled)):
+                    initTime = pyt.tt.float2format(self.initTimes[iInit])
+                    print(f'not found {case.model.name}{nobc} member={members[iMember]} {initTime}')
 
         # ---- output
         self.pc1_valid, self.pc2_valid = pc1_valid, pc2_valid
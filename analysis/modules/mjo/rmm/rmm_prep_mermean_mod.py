@@ -4,6 +4,7 @@
     OLR, U850, U200 on 2.5 degree over the 
     15S-15N band for calculating RMM indices.
 '''
+from .rmm_store import open_mermean
 import pytools as pyt
 import numpy as np
 import os
@@ -19,7 +20,7 @@ def main():
     run(modelName, initTimes, members)
 
 
-def run(modelName, initTimes, members, dataDir, climYears=[2006, 2020]):
+def run(modelName, initTimes, members, dataDir, climYears=[2006, 2020], dtype='float64'):
     #
     # ---- init
     # settings
@@ -49,20 +50,8 @@ def run(modelName, initTimes, members, dataDir, climYears=[2006, 2020]):
         fp.flush(f'running {
             pyt.tt.float2format(initTime, "%Y%m%d %Hz")
             }, member={member}, {varName} ')
-        desPath = pyt.tt.float2format(
-            initTime,
-            f'{desRoot}/%Y/E{member:03d}/%y%m%d_{varName}.nc'
-        )
-        desDir = os.path.dirname(desPath)
-
-        if not os.path.exists(desDir):
-            os.system(f'mkdir -p {desDir}')
-
-        if not pyt.ft.canBeWritten(desPath):
-            raise PermissionError(f'{desPath}')
-
-        if os.path.exists(desPath):
-            fp.print(f'skip existing file {desPath}')
+        if stores[varName].has(initTime, member):
+            fp.print(f'skip existing member={member} in {stores[varName].path}')
             return
 
         #
@@ -87,6 +76,7 @@ def run(modelName, initTimes, members, dataDir, climYears=[2006, 2020]):
             return
 
         data = np.squeeze(data, axis=(0, 1)) # initTime and member dimension
+        data = data.astype(dtype, copy=False)
 
         if ncVarName == 'u': # remove level
             data = np.squeeze(data, -3)
@@ -95,22 +85,21 @@ def run(modelName, initTimes, members, dataDir, climYears=[2006, 2020]):
         data = np.nanmean(data, axis=-2) # meridional mean
         data = pyt.ct.interp_1d(dims[-1], data, LON, axis=-1, extrapolate=True)
 
-        pyt.nct.save(
-            desPath, {
-                varName: data,
-                'time': [initTime + lead for lead in dims[0]],
-                'lon':LON
-            }
-        )
+        stores[varName].write(initTime, member, {varName: data})
 
     #
     # --- loop over the core
-    for initTime in initTimes:
-        for member in members:
-            if member < 0:
-                continue
-            for varName in varNames:
-                readcalsave(initTime, member, varName)
+    stores = {varName: open_mermean(desRoot, varName, series=True, dtype=dtype) for varName in varNames}
+    try:
+        for initTime in initTimes:
+            for member in members:
+                if member < 0:
+                    continue
+                for varName in varNames:
+                    readcalsave(initTime, member, varName)
+    finally:
+        for store in stores.values():
+            store.close()
 
     fp.print(f'< exiting {pyt.ft.getModuleName()}')
 
@@ -4,6 +4,8 @@
     OLR, U850, U200 on 2.5 degree over the 
     15S-15N band for calculating RMM indices.
 '''
+from obs_cache import get_obs_cache, make_key
+from .rmm_store import open_mermean
 import pytools as pyt
 import numpy as np
 import os
@@ -19,7 +21,7 @@ def main():
     run(modelName, initTimes, members)
 
 
-def run(modelName, initTimes, members, dataDir):
+def run(modelName, initTimes, members, dataDir, dtype='float64'):
     #
     # ---- init
     # settings
@@ -36,6 +38,7 @@ def run(modelName, initTimes, members, dataDir):
     #
     # ---- post init
     fp = pyt.tmt.FlushPrinter()
+    obsCache = get_obs_cache(f'{dataDir}/cache/obs')
     fp.print(f'> running {pyt.ft.getModuleName()}')
 
     if not os.path.exists(desRoot):
@@ -46,51 +49,58 @@ def run(modelName, initTimes, members, dataDir):
 
     #
     # --- core
+    def get_settings(varName):
+        # ncVarName, obsSource, minMaxsObs, minMaxsMod
+        if varName == 'olr':
+            minMaxs = [[None]*2, [lats, latn], [None]*2]
+            return 'olr', None, minMaxs, minMaxs
+        elif varName == 'u850':
+            return 'u', 'era5_prs_daymean', \
+                [[None]*2, [850]*2, [lats, latn], [None]*2], \
+                [[None]*2, [850_00]*2, [lats, latn], [None]*2]
+        elif varName == 'u200':
+            return 'u', 'era5_prs_daymean', \
+                [[None]*2, [200]*2, [lats, latn], [None]*2], \
+                [[None]*2, [200_00]*2, [lats, latn], [None]*2]
+
+    def shapeManipulation(data, dims, ncVarName):
+        if ncVarName == 'u': # remove level
+            data = np.squeeze(data, -3)
+            dims = [dims[i] for i in [0, 2, 3]]
+        data = np.nanmean(data, axis=-2) # meridional mean
+        data = pyt.ct.interp_1d(dims[-1], data, LON, axis=-1, extrapolate=True)
+        return data, dims
+
+    def get_clim(varName):
+        '''
+        the mermean obs climatology of all the days, (366, 144), indexed by dayOfYear229 - 1
+        reduced once per variable and climYears, and kept in the obs cache across runs
+        '''
+        ncVarName, obsSource, minMaxsObs, _ = get_settings(varName)
+
+        def read():
+            clim, dimsClim = pyt.rt.obsReader.clim(
+                ncVarName, [[None]*2, *minMaxsObs[1:]], obsSource, climYears=climYears
+            )
+            clim, dimsClim = shapeManipulation(clim, dimsClim, ncVarName)
+
+            out = np.full((366, len(LON)), np.nan)
+            out[np.asarray(dimsClim[0], dtype=int)] = clim
+            return out, [np.arange(366), LON]
+
+        key = make_key('clim_mermean', varName, obsSource, climYears=climYears, grid=(lats, latn, 'LON2.5'))
+        clim, _ = obsCache.get(key, [0, 365], read)
+        return clim
+
     def readcalsave(initTime, member, varName):
         fp.flush(f'running {
             pyt.tt.float2format(initTime, "%Y%m%d %Hz")
             }, member={member}, {varName} ')
-        desPath = pyt.tt.float2format(
-            initTime,
-            f'{desRoot}/%Y/E{member:03d}/%y%m%d_{varName}.nc'
-        )
-        desDir = os.path.dirname(desPath)
-
-        if not os.path.exists(desDir):
-            os.system(f'mkdir -p {desDir}')
-
-        if not pyt.ft.canBeWritten(desPath):
-            raise PermissionError(f'{desPath}')
-
-        if os.path.exists(desPath):
-            fp.print(f'skip existing file {desPath}')
+        if stores[varName].has(initTime, member):
+            fp.print(f'skip existing member={member} in {stores[varName].path}')
             return
 
-        #
-        # ---- variable dependent
-        if varName == 'olr':
-            ncVarName = 'olr'
-            obsSource = None
-            minMaxsObs = [[None]*2, [lats, latn], [None]*2]
-            minMaxsMod = minMaxsObs
-        elif varName == 'u850':
-            ncVarName = 'u'
-            obsSource = 'era5_prs_daymean'
-            minMaxsObs = [[None]*2, [850]*2, [lats, latn], [None]*2]
-            minMaxsMod = [[None]*2, [850_00]*2, [lats, latn], [None]*2]
-        elif varName == 'u200':
-            ncVarName = 'u'
-            minMaxsObs = [[None]*2, [200]*2, [lats, latn], [None]*2]
-            minMaxsMod = [[None]*2, [200_00]*2, [lats, latn], [None]*2]
-            obsSource = 'era5_prs_daymean'
-
-        def shapeManipulation(data, dims):
-            if ncVarName == 'u': # remove level
-                data = np.squeeze(data, -3)
-                dims = [dims[i] for i in [0, 2, 3]]
-            data = np.nanmean(data, axis=-2) # meridional mean
-            data = pyt.ct.interp_1d(dims[-1], data, LON, axis=-1, extrapolate=True)
-            return data, dims
+        ncVarName, _, _, minMaxsMod = get_settings(varName)
 
         #
         # ---- read  model data
@@ -101,38 +111,30 @@ def run(modelName, initTimes, members, dataDir):
             return
 
         data = np.squeeze(data, axis=(0, 1)) # initTime and member dimension
-        data, dims = shapeManipulation(data, dims)
-
+        data = data.astype(dtype, copy=False)
+        data, dims = shapeManipulation(data, dims, ncVarName)
 
         #
-        # ---- read obs clim data
+        # ---- calculate anomalies, the obs clim of the valid dates in one gather
         validDates = [int(initTime + lead) for lead in dims[0]]
-        minMaxsObs[0] = [min(validDates), max(validDates)]
-        clim, dimsClim = pyt.rt.obsReader.clim(ncVarName, minMaxsObs, obsSource, climYears=climYears)
-        clim, dimsClim = shapeManipulation(clim, dimsClim)
+        iDateClim = [pyt.tt.dayOfYear229(vd)-1 for vd in validDates]
+        data -= get_clim(varName)[iDateClim, :]
 
-        #
-        # ---- calculate anomalies
-        climTime = list(dimsClim[0])
-        iDateClim = [climTime.index(pyt.tt.dayOfYear229(vd)-1) for vd in validDates]
-        data -= clim[iDateClim, :]
-
-        pyt.nct.save(
-            desPath, {
-                varName: data,
-                'time': [initTime + lead for lead in dims[0]],
-                'lon':LON
-            }
-        )
+        stores[varName].write(initTime, member, {varName: data})
 
     #
     # --- loop over the core
-    for initTime in initTimes:
-        for member in members:
-            if member < 0:
-                continue
-            for varName in varNames:
-                readcalsave(initTime, member, varName)
+    stores = {varName: open_mermean(desRoot, varName, series=True, dtype=dtype) for varName in varNames}
+    try:
+        for initTime in initTimes:
+            for member in members:
+                if member < 0:
+                    continue
+                for varName in varNames:
+                    readcalsave(initTime, member, varName)
+    finally:
+        for store in stores.values():
+            store.close()
 
     fp.print(f'< exiting {pyt.ft.getModuleName()}')
 
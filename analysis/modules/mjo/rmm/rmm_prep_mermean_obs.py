@@ -4,6 +4,7 @@
     OLR, U850, U200 on 2.5 degree over the 
     15S-15N band for calculating RMM indices.
 '''
+from .rmm_store import open_mermean
 import pytools as pyt
 import numpy as np
 import os
@@ -13,7 +14,10 @@ def main():
     run(pyt.tt.ymd2float(2024, 9, 3), pyt.tt.ymd2float(2025, 1, 1))
 
 
-def run(dateStart, dateEnd, dataDir):
+def run(dateStart, dateEnd, dataDir, dtype='float64', daysPerRead=366):
+    '''
+    the dates are read, reduced and written by blocks of daysPerRead
+    '''
     #
     # ---- init
     lats, latn = -15, 15
@@ -47,82 +51,87 @@ def run(dateStart, dateEnd, dataDir):
     if not os.access(desRoot, os.W_OK):
         raise PermissionError(f'denied to write to {desRoot}')
 
+    stores = {varName: open_mermean(desRoot, varName, series=False, dtype=dtype) for varName in varNames}
+
     #
     # ---- core
-    def readcalsave(date, varName):
-        fp.flush(f'running {pyt.tt.float2format(date)} {varName} ')
-        desPath = pyt.tt.float2format(date, f'{desRoot}/%Y/%y%m%d_{varName}.nc')
-        desDir = os.path.dirname(desPath)
-
-        if not os.path.exists(desDir):
-            os.system(f'mkdir -p {desDir}')
-
-        if not pyt.ft.canBeWritten(desPath):
-            raise PermissionError(f'{desPath}')
-
-        if os.path.exists(desPath):
-            fp.print(f'skip existing file {desPath}')
-            return
-
-        #
-        # ---- variable dependent
-        if varName == 'olr': # date + 0.99 to include the time of daymean
+    def read_anomaly(varName, timeRange):
+        # the blocks are read once, so not through the obs cache (it would keep them in memory)
+        if varName == 'olr':
             ncVarName = 'olr'
-            minMaxs = [[date, date+0.99], [lats, latn], [None]*2]
+            minMaxs = [timeRange, [lats, latn], [None]*2]
         elif varName == 'u850':
             ncVarName = 'u'
-            minMaxs = [[date, date+0.99], [850]*2, [lats, latn], [None]*2]
+            minMaxs = [timeRange, [850]*2, [lats, latn], [None]*2]
         elif varName == 'u200':
             ncVarName = 'u'
-            minMaxs = [[date, date+0.99], [200]*2, [lats, latn], [None]*2]
+            minMaxs = [timeRange, [200]*2, [lats, latn], [None]*2]
+
+        return pyt.rt.obsReader.anomaly(ncVarName, minMaxs, dataSource[ncVarName], root=obsRoot)
+
+    def cal_mermean(data, dims, varName):
+        # (time, [lev], lat, lon) -> (time, lon) on LON, all the days at once
+        if varName != 'olr': # remove level
+            data = np.squeeze(data, -3)
+            dims = [dims[i] for i in [0, 2, 3]]
+
+        data = data.astype(dtype, copy=False)
+        data = np.nanmean(data, axis=-2) # meridional mean
+        return pyt.ct.interp_1d(dims[-1], data, LON, axis=-1, extrapolate=True)
+
+    def readcalsave(varName, datesBlock):
+        store = stores[varName]
+        datesTodo = [date for date in datesBlock if not store.has(date)]
+        if len(datesTodo) == 0:
+            fp.print(f'skip existing {varName} {pyt.tt.float2format(datesBlock[0])}-{pyt.tt.float2format(datesBlock[-1])}')
+            return
+
+        timeRange = [datesTodo[0], datesTodo[-1]]
+        fp.flush(f'running {varName} {"-".join([pyt.tt.float2format(d) for d in timeRange])} ')
 
         #
-        # ---- read data
+        # ---- read data (+ 0.99 to include the time of daymean)
         try:
-            data, dims = pyt.rt.obsReader.anomaly(
-                ncVarName, minMaxs, dataSource[ncVarName], root=obsRoot,
-            )
-        except ValueError:
-            fp.appendPrint(
-                f'skipping because date not found in files' \
-                + f'{obsRoot=}'
-            )
+            data, dims = read_anomaly(varName, [timeRange[0], timeRange[1]+0.99])
+        except (ValueError, FileNotFoundError) as e:
+            if len(datesTodo) > 1:
+                fp.print(f'unable to read {varName} at once, fall back to daily reads')
+                for date in datesTodo:
+                    readcalsave(varName, [date])
+            else:
+                fp.appendPrint(f'skipping because {e} {obsRoot=}')
             return
-        except FileNotFoundError:
-            fp.appendPrint(
-                f'skipping because file not found' \
-                + f'{obsRoot=}'
-            )
+
+        data = cal_mermean(data, dims, varName)
+
+        # the days of the block in the data
+        iDays = {int(np.floor(t)): iTime for iTime, t in enumerate(dims[0])}
+        datesFound = [date for date in datesTodo if int(date) in iDays]
+        if len(datesFound) < len(datesTodo):
+            fp.appendPrint(f'skipping {len(datesTodo) - len(datesFound)} dates not found in files {obsRoot=}')
+        if len(datesFound) == 0:
             return
+        data = data[[iDays[int(date)] for date in datesFound]]
 
         # fix it: NOAA OLR data is corrupted on 2024-02-01
-        if date == pyt.tt.ymd2float(2024, 2, 1) and varName == 'olr':
-            tmp, _ = pyt.rt.obsReader.anomaly(
-                ncVarName,
-                [[pyt.tt.ymd2float(2024, 1, 31), pyt.tt.ymd2float(2024, 2, 2)], *minMaxs[1:]],
-                dataSource[ncVarName], root=obsRoot,
+        dateCorrupted = pyt.tt.ymd2float(2024, 2, 1)
+        if varName == 'olr' and dateCorrupted in datesFound:
+            tmp, tmpDims = read_anomaly(
+                varName, [pyt.tt.ymd2float(2024, 1, 31), pyt.tt.ymd2float(2024, 2, 2)],
             )
-            data[0, :] = (tmp[0, :] + tmp[-1, :]) / 2
-
-        if ncVarName == 'u': # remove level
-            data = np.squeeze(data, -3)
-            dims = [dims[i] for i in [0, 2, 3]]
-
-        data = np.nanmean(data, axis=-2) # meridional mean
-        data = pyt.ct.interp_1d(dims[-1], data, LON, axis=-1, extrapolate=True)
+            tmp = cal_mermean(tmp, tmpDims, varName)
+            data[datesFound.index(dateCorrupted), :] = (tmp[0, :] + tmp[-1, :]) / 2
 
-        pyt.nct.save(
-            desPath, {
-                varName: data,
-                'time': [date],
-                'lon':LON,
-            }
-        )
+        store.write_many(datesFound, 0, {varName: data})
 
     # ---- loop over the core
-    for date in dates:
+    try:
         for varName in varNames:
-            readcalsave(date, varName)
+            for iDate in range(0, len(dates), daysPerRead):
+                readcalsave(varName, dates[iDate:iDate+daysPerRead])
+    finally:
+        for store in stores.values():
+            store.close()
 
     fp.print(f'< exiting {pyt.ft.getModuleName()}')
 
@@ -0,0 +1,134 @@
+#!/nwpr/gfs/com120/.conda/envs/rd/bin/python
+'''
+    The stores of the mermean and RMM data, one file per (source, variable)
+        {dataDir}/MJO/mermean_15NS/{source}/{varName}.nc
+        {dataDir}/MJO/RMM/{source}/RMM.nc
+    the source is obs, {modelName} or {modelName}-noBC. the obs are
+    stored by date, the models by init time and member with a lead axis.
+
+    The per-day files of the older runs are moved into the stores by
+        python -m modules.mjo.rmm.rmm_store migrate {dataDir} [--remove]
+'''
+from ts_store import open_store
+from manifest import get_manifest
+import pytools as pyt
+import numpy as np
+import argparse
+import re
+import os
+
+
+LON = np.r_[0:360:2.5]
+
+
+def open_mermean(srcRoot, varName, series, mode='a', dtype='float64'):
+    '''
+    srcRoot: {dataDir}/MJO/mermean_15NS/{source}
+    series: True for the models, (init, member, lead, lon), False for the obs, (date, 0, lon)
+    '''
+    if series:
+        return open_store(f'{srcRoot}/{varName}.nc', [varName], {'lead': None, 'lon': LON},
+                          mode=mode, dtype=dtype, timeChunk=1)
+    return open_store(f'{srcRoot}/{varName}.nc', [varName], {'lon': LON}, mode=mode, dtype=dtype)
+
+
+def open_rmm(srcRoot, series, mode='a'):
+    '''
+    srcRoot: {dataDir}/MJO/RMM/{source}
+    series: True for the models, (init, member, lead), False for the obs, (date, 0)
+    '''
+    if series:
+        return open_store(f'{srcRoot}/RMM.nc', ['pc1', 'pc2'], {'lead': None}, mode=mode)
+    return open_store(f'{srcRoot}/RMM.nc', ['pc1', 'pc2'], mode=mode)
+
+
+def migrate(dataDir, remove=False):
+    '''
+    move the per-day files into the stores, the slots already in the stores are skipped
+    '''
+    manifest = get_manifest(dataDir)
+    fp = pyt.tmt.FlushPrinter()
+    products = [
+        (f'{dataDir}/MJO/mermean_15NS', r'(\d{6})_(olr|u850|u200)\.nc'),
+        (f'{dataDir}/MJO/RMM', r'(\d{6})_(RMM)\.nc'),
+    ]
+    for productRoot, pattern in products:
+        if not os.path.isdir(productRoot):
+            continue
+
+        for source in sorted(os.listdir(productRoot)):
+            srcRoot = f'{productRoot}/{source}'
+            if not os.path.isdir(srcRoot):
+                continue
+
+            # {varName: [(time, member, path)]}
+            files = {}
+            for path in _walk(srcRoot):
+                parts = os.path.relpath(path, srcRoot).split(os.sep)
+                match = re.fullmatch(pattern, parts[-1])
+                if match is None or not parts[0].isdigit():
+                    continue
+                if len(parts) == 3 and re.fullmatch(r'E-?\d+', parts[1]):
+                    member = int(parts[1][1:])
+                elif len(parts) == 2:
+                    member = None
+                else:
+                    continue
+                ymd = match.group(1)
+                time = pyt.tt.ymd2float(int(parts[0]), int(ymd[2:4]), int(ymd[4:6]))
+                files.setdefault(match.group(2), []).append((time, member, path))
+
+            for varName, records in files.items():
+                series = records[0][1] is not None
+                if any([(member is not None) != series for _, member, _ in records]):
+                    print(f'[warning] skip {srcRoot} {varName}, mixed obs and model files')
+                    continue
+
+                if varName == 'RMM':
+                    store = open_rmm(srcRoot, series)
+                    varNames = ['pc1', 'pc2']
+                else:
+                    store = open_mermean(srcRoot, varName, series)
+                    varNames = [varName]
+
+                numMigrated = 0
+                with store:
+                    for time, member, path in sorted(records, key=lambda r: (r[0], r[1] or 0)):
+                        fp.flush(f'migrating {path}')
+                        member = member or 0
+                        if not store.has(time, member):
+                            data = {name: pyt.nct.read(path, name) for name in varNames}
+                            if not series: # a single date
+                                data = {name: values[0] for name, values in data.items()}
+                            store.write(time, member, data)
+                            numMigrated += 1
+                fp.print(f'{numMigrated}/{len(records)} slots migrated into {store.path}')
+
+                # only after the store is closed, so the slots are on disk
+                if remove:
+                    for _, _, path in records:
+                        os.remove(path)
+                        manifest.forget(path)
+
+
+def _walk(root):
+    for entry in os.scandir(root):
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk(entry.path)
+        elif entry.is_file():
+            yield entry.path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='the stores of the mermean and RMM data')
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('dataDir', help='the data root with MJO/mermean_15NS and MJO/RMM')
+    parser.add_argument('--remove', action='store_true', help='remove the per-day files after migrating them')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate(args.dataDir, args.remove)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,14 +12,14 @@ import os
 
 def run(cases, dataDir, figDir, option):
     if option.do_data:
-        _run_data(cases, dataDir)
+        _run_data(cases, dataDir, option.dtype)
 
     if option.do_plot:
         _run_plot(cases, dataDir, figDir, option)
 
 
 @greeter
-def _run_data(cases, dataDir):
+def _run_data(cases, dataDir, dtype='float64'):
     # takle with inputs
     models = [case.model for case in cases]
     # prepare data
@@ -34,7 +34,7 @@ def _run_data(cases, dataDir):
     obsDateEnd = maxInitTimes + maxNumLeads
 
     # ---- runs
-    mermean_obs(obsDateStart - numPrevDays, obsDateEnd, dataDir)
+    mermean_obs(obsDateStart - numPrevDays, obsDateEnd, dataDir, dtype=dtype)
     indices_obs(obsDateStart, obsDateEnd, dataDir)
 
     for model in models:
@@ -42,10 +42,10 @@ def _run_data(cases, dataDir):
         initTimes = model.initTimes
         members = model.members
 
-        mermean_mod_nobc(model.name, initTimes, members, dataDir)
+        mermean_mod_nobc(model.name, initTimes, members, dataDir, dtype=dtype)
         indices_mod(model.name, initTimes, members, dataDir, clim_bc=False)
         if model.hasClim:
-            mermean_mod(model.name, initTimes, members, dataDir, model.climYears)
+            mermean_mod(model.name, initTimes, members, dataDir, model.climYears, dtype=dtype)
             indices_mod(model.name, initTimes, members, dataDir, clim_bc=True)
 
 @greeter
@@ -151,6 +151,7 @@ class Option(): # defalt options
     do_data: bool = True
     do_plot: bool = True
     fig_subdir: str = ''
+    dtype: str = 'float64' # precision of the data read in the mermean preparation
     phase_diagram: dict = field(default_factory=dict)
     score_diagram: dict = field(default_factory=dict)
 
@@ -159,6 +160,9 @@ class Option(): # defalt options
         pyt.chkt.checkType(self.phase_diagram, dict, 'phase_diagram')
         pyt.chkt.checkType(self.score_diagram, dict, 'score_diagram')
         pyt.chkt.checkType(self.fig_subdir, str , 'fig_subdir')
+        pyt.chkt.checkType(self.dtype, str , 'dtype')
+        if self.dtype not in ['float32', 'float64']:
+            raise ValueError(f'dtype must be float32 or float64, {self.dtype=}')
         self.phase_diagram = Option_Phase_Diagram(**self.phase_diagram)
         self.score_diagram = Option_Score_Diagram(**self.score_diagram)
 
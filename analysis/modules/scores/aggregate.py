@@ -0,0 +1,138 @@
+'''
+Regional aggregates of the score fields.
+
+The area-weighted (cos lat) mean, std and count of valid grid points of each
+score are taken over every region of a registry when the scores are saved,
+so the plots and score cards read a (region, [lev], lead) table of a few
+kilobytes instead of the global fields.
+
+----
+aggregates = cal_aggregates(scores, dims, regions)        # in the writer
+save_aggregates(path, aggregates, regions, dims)
+mean, std, count = read_aggregate(path, 'acc', 'Trop', level=850)
+table, levels, leads = read_aggregates(path, ['bias', 'acc'], regions)   # all regions at once
+'''
+import pytools as pyt
+import numpy as np
+import ncwriter
+
+
+STAT_NAMES = ['mean', 'std', 'count']
+
+
+def cal_aggregates(scores, dims, regions):
+    '''
+    scores: {scoreName: (lead, [lev], lat, lon)}
+    regions: with name, lonw, lone, lats, latn (e.g., subdriver.Region)
+    return {scoreName: {'mean', 'std', 'count': (region, [lev], lead)}}
+    '''
+    lon = np.asarray(dims[-1], dtype=float)
+    lat = np.asarray(dims[-2], dtype=float)
+    coslat = np.cos(np.deg2rad(lat))[:, None] * np.ones((1, len(lon)))
+
+    aggregates = {}
+    for scoreName, score in scores.items():
+        score = np.asarray(score)
+        outShape = (len(regions), *score.shape[:-2][::-1]) # (region, [lev], lead)
+        aggregate = {name: np.full(outShape, np.nan) for name in STAT_NAMES}
+
+        for iRegion, region in enumerate(regions):
+            inLon = (region.lonw <= lon) & (lon <= region.lone)
+            inLat = (region.lats <= lat) & (lat <= region.latn)
+            data = score[..., inLat, :][..., inLon] # (lead, [lev], y, x)
+            weight = coslat[inLat][:, inLon]
+
+            valid = ~np.isnan(data)
+            weights = np.where(valid, weight, 0)
+            sumWeights = np.sum(weights, axis=(-1, -2))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean = np.sum(np.where(valid, data, 0) * weights, axis=(-1, -2)) / sumWeights
+                var = np.sum(
+                    np.where(valid, data - mean[..., None, None], 0) ** 2 * weights, axis=(-1, -2)
+                ) / sumWeights
+
+            aggregate['mean'][iRegion] = mean.T
+            aggregate['std'][iRegion] = np.sqrt(var).T
+            aggregate['count'][iRegion] = np.sum(valid, axis=(-1, -2)).T
+
+        aggregates[scoreName] = aggregate
+    return aggregates
+
+
+def save_aggregates(path, aggregates, regions, dims):
+    if len(dims) == 4:
+        dimStruct = {'region': np.arange(len(regions)), 'lev': dims[-3], 'lead': dims[0]}
+    else:
+        dimStruct = {'region': np.arange(len(regions)), 'lead': dims[0]}
+
+    regionAttrs = {}
+    for iRegion, region in enumerate(regions):
+        regionAttrs[f'{iRegion}_name'] = region.name
+        regionAttrs[f'{iRegion}_boundary'] = [region.lonw, region.lone, region.lats, region.latn]
+
+    ncwriter.save(
+        path, {
+            f'{scoreName}_{name}': aggregate[name]
+            for scoreName, aggregate in aggregates.items()
+            for name in STAT_NAMES
+        },
+        dimStruct, varAttrs={'region': regionAttrs},
+    )
+
+
+def read_aggregate(path, scoreName, regionName, boundary=None, level=None):
+    '''
+    return mean, std, count over lead, or None if the region is not in the table
+    - boundary: [w, e, s, n], also require the region in the table to match it
+    '''
+    iRegion = _find_region(path, regionName, boundary)
+    if iRegion is None:
+        return None
+
+    out = []
+    for name in STAT_NAMES:
+        data = pyt.nct.read(path, f'{scoreName}_{name}')[iRegion]
+        if level is not None:
+            levels = list(pyt.nct.read(path, 'lev'))
+            if level not in levels:
+                return None
+            data = data[levels.index(level)]
+        out.append(data)
+    return out
+
+
+def read_aggregates(path, scoreNames, regions):
+    '''
+    read the whole table once for all the regions
+    return {scoreName: {'mean', 'std', 'count': (region, [lev], lead)}}, levels, leads
+    or None if any of the regions is not in the table
+    - regions: with name and boundary, in the order of the output
+    '''
+    iRegions = [_find_region(path, region.name, region.boundary) for region in regions]
+    if any([iRegion is None for iRegion in iRegions]):
+        return None
+
+    table = {
+        scoreName: {
+            name: pyt.nct.read(path, f'{scoreName}_{name}')[iRegions]
+            for name in STAT_NAMES
+        }
+        for scoreName in scoreNames
+    }
+    hasLevels = table[scoreNames[0]]['mean'].ndim == 3 # (region, lev, lead)
+    levels = pyt.nct.read(path, 'lev') if hasLevels else None
+    leads = pyt.nct.read(path, 'lead')
+    return table, levels, leads
+
+
+def _find_region(path, regionName, boundary):
+    numRegions = len(pyt.nct.read(path, 'region'))
+    for iRegion in range(numRegions):
+        if pyt.nct.ncreadattt(path, 'region', f'{iRegion}_name') != regionName:
+            continue
+        if boundary is not None:
+            boundarySaved = list(pyt.nct.ncreadattt(path, 'region', f'{iRegion}_boundary'))
+            if [float(b) for b in boundarySaved] != [float(b) for b in boundary]:
+                continue
+        return iRegion
+    return None
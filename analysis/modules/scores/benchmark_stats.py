@@ -0,0 +1,86 @@
+'''
+Benchmark the blocked score kernel (stats.cal_stats) against the original
+_cal_scores, which masked the fill values in place and made a full-size
+temporary for every term.
+
+----
+cd analysis
+python -m modules.scores.benchmark_stats                           # (90, 45, 11, 181, 360)
+python -m modules.scores.benchmark_stats --shape 90 45 181 360 --dtype float64
+'''
+import numpy as np
+import tracemalloc
+import argparse
+import time
+from . import stats
+
+
+def legacy_cal_scores(o, f):
+    o[(np.abs(o) > 1e10)] = np.nan
+    f[(np.abs(f) > 1e10)] = np.nan
+    bias = np.nanmean(o - f, axis=0)
+    rmse = np.sqrt(np.nanmean((o - f) ** 2, axis=0))
+    acc = np.nansum(f * o, axis=0) \
+        / np.sqrt(np.nansum(f ** 2, axis=0)) \
+        / np.sqrt(np.nansum(o ** 2, axis=0))
+
+    return {
+        'bias': bias,
+        'rmse': rmse,
+        'acc': acc,
+    }
+
+
+def kernel_cal_scores(o, f):
+    return stats.stats_to_scores(stats.cal_stats(o, f))
+
+
+def measure(func, o, f):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    scores = func(o, f)
+    seconds = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return scores, seconds, peak
+
+
+def make_inputs(shape, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    o = rng.standard_normal(shape, dtype=np.float32).astype(dtype, copy=False)
+    f = (o + rng.standard_normal(shape, dtype=np.float32)).astype(dtype, copy=False)
+    o.flat[::97] = np.nan # missing obs
+    f.flat[::101] = 9.999e20 # fill values
+    return o, f
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('----')[0])
+    parser.add_argument('--shape', type=int, nargs='+', default=[90, 45, 11, 181, 360])
+    parser.add_argument('--dtype', default='float32')
+    args = parser.parse_args()
+
+    shape = tuple(args.shape)
+    o, f = make_inputs(shape, args.dtype)
+    print(f'{shape=}, dtype={args.dtype}, input size={2 * o.nbytes / 1024**3:.2f} GB')
+
+    scoresNew, secondsNew, peakNew = measure(kernel_cal_scores, o, f)
+
+    # the original masks in place, so feed it copies (not timed)
+    oCopy, fCopy = o.copy(), f.copy()
+    scoresOld, secondsOld, peakOld = measure(legacy_cal_scores, oCopy, fCopy)
+    del oCopy, fCopy
+
+    print(f'{"":>10} {"seconds":>10} {"peak GB":>10}')
+    print(f'{"original":>10} {secondsOld:10.2f} {peakOld / 1024**3:10.2f}')
+    print(f'{"kernel":>10} {secondsNew:10.2f} {peakNew / 1024**3:10.2f}')
+    print(f'speedup = {secondsOld / secondsNew:.2f}x')
+
+    # the same definitions, only the summation order differs
+    for name in ['bias', 'rmse', 'acc']:
+        diff = np.nanmax(np.abs(scoresNew[name] - scoresOld[name]))
+        print(f'max |difference| of {name} = {diff:.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,18 @@
 from driver import safe_runner
 import pytools as pyt
-from reader import Reader
+from reader import Reader, Data
+import parallel
+import ncwriter
+from manifest import get_manifest
 import numpy as np
+import warnings
+import re
 import os
 from . import path
-import copy
+from . import stats
+from . import windows
+from . import aggregate
+from . import ensemble
 
 '''
 todo: prec is limited to tropical bands for CMORPH but the values are extrapolated outside
@@ -26,11 +34,9 @@ def run(cases, dataDir, option):
 
     # create output directories
     for case in cases:
-        for member in case.model.members:
-            if option.do_data_1day:
-                _create_output_dir(dataDir, case.model, member, '1day')
-            if option.do_data_7dma:
-                _create_output_dir(dataDir, case.model, member, '7dma')
+        for member in _get_members(case.model, option):
+            for window in option.windows:
+                _create_output_dir(dataDir, case.model, member, windows.get_window_name(window))
 
     # run by variables
     for variable in option.variables:
@@ -40,11 +46,7 @@ def run(cases, dataDir, option):
 @safe_runner
 def _run_variable(cases, dataDir, variable, option):
     print(f'         variable = {variable.name}')
-    ndmas = []
-    if option.do_data_1day:
-        ndmas.append('1day')
-    if option.do_data_7dma:
-        ndmas.append('7dma')
+    ndmas = [windows.get_window_name(window) for window in option.windows]
 
     # check if we can skip this variable
     if option.force:
@@ -52,11 +54,15 @@ def _run_variable(cases, dataDir, variable, option):
     else:
         canSkip = True
         for case in cases:
-            for member in case.model.members:
+            for member in _get_members(case.model, option):
                 skipRaw, skipBC = _get_skips(dataDir, case.model, member, variable, ndmas)
                 if not skipRaw or not skipBC:
                     canSkip = False
                     break
+                # the scores of a window may be written before all its initTimes are folded
+                if option.incremental and any(_get_todo_inits(dataDir, case.model, member, variable, ndmas)[:2]):
+                    canSkip = False
+                    break
             if not canSkip:
                 break
 
@@ -69,13 +75,26 @@ def _run_variable(cases, dataDir, variable, option):
         dataDir, 
         regrid_delta_x=option.regrid_delta_x,
         regrid_delta_y=option.regrid_delta_y, 
+        dtype=option.dtype,
+        boundary=_get_boundary(option),
     )
     
     # read obs total, clim, and anomaly
-    initTimes = [
-        min([min(case.model.initTimes) for case in cases]),
-        max([max(case.model.initTimes) for case in cases]),
-    ]
+    if option.incremental and not option.force: # only the initTimes not folded yet need the obs
+        todoInitTimes = [
+            case.model.initTimes[i]
+            for case in cases
+            for member in case.model.members
+            for i in _get_todo_inits(dataDir, case.model, member, variable, ndmas)[0]
+        ]
+        if not todoInitTimes: # nothing to read, but the scores may still be written
+            todoInitTimes = [cases[0].model.initTimes[0]]
+        initTimes = [min(todoInitTimes), max(todoInitTimes)]
+    else:
+        initTimes = [
+            min([min(case.model.initTimes) for case in cases]),
+            max([max(case.model.initTimes) for case in cases]),
+        ]
     numLeads = max([case.model.numLeads for case in cases])
     obsTimeRange = reader.get_valid_time_range(initTimes, numLeads)
 
@@ -84,11 +103,64 @@ def _run_variable(cases, dataDir, variable, option):
     OBSTOTAL, OBSCLIM = reader.conform_axis(OBSTOTAL, OBSCLIM, axis=-3)
     OBSANOM = OBSTOTAL - OBSCLIM
 
+    # the last time with any obs, the initTimes with later valid times are not folded yet
+    hasObs = ~np.all(np.isnan(OBSTOTAL.vals.reshape(OBSTOTAL.vals.shape[0], -1)), axis=1)
+    obsTimeEnd = np.max(np.asarray(OBSTOTAL.dims[0])[hasObs]) if np.any(hasObs) else -np.inf
+
+    # the obs at valid times (and their running means) are the same for all members,
+    # they are built once per case before the workers fork and shared with them
+    def build_valids(model, obsClim):
+        '''
+        return iInit0, {ndma: (validAnom, validClim)} of the model.initTimes in the obs
+        range from iInit0 on, all windows from one cumulative sum
+        '''
+        iInits = [i for i, t in enumerate(model.initTimes) if initTimes[0] <= t <= initTimes[1]]
+        if not iInits:
+            return 0, None
+
+        # only the shape (lead) and the levels of the model are needed
+        validInitTimes = model.initTimes[iInits[0]:iInits[-1] + 1]
+        modTemplate = Data(
+            np.broadcast_to(np.float32(np.nan), (len(validInitTimes), model.numLeads, *obsClim.vals.shape[1:])),
+            [validInitTimes, list(range(model.numLeads)), *obsClim.dims[1:]],
+        )
+        validAnom, _ = reader.obs_to_valid(OBSANOM, modTemplate, validInitTimes, asView=True)
+        validClim, _ = reader.obs_to_valid(obsClim, modTemplate, validInitTimes, asView=True)
+        anoms = windows.running_means(validAnom.vals, option.windows, axis=1)
+        clims = windows.running_means(validClim.vals, option.windows, axis=1)
+
+        valids = {}
+        for window in option.windows:
+            anom, clim = anoms[window], clims[window]
+            anom.flags.writeable = False
+            clim.flags.writeable = False
+            valids[windows.get_window_name(window)] = (
+                Data(anom, validAnom.dims), Data(clim, validClim.dims)
+            )
+        return iInits[0], valids
+
+    def get_valids(VALIDS, iInits, modTotal):
+        '''
+        return {ndma: (validAnom, validClim)} of iInits, views of the shared valids
+        where the levels of the model are the same
+        '''
+        iInit0, valids = VALIDS
+        index = _to_slice([i - iInit0 for i in iInits])
+        out = {}
+        for ndma, (validAnom, validClim) in valids.items():
+            validAnom = Data(validAnom.vals[index], validAnom.dims)
+            validClim = Data(validClim.vals[index], validClim.dims)
+            if variable.ndim == 4:
+                validAnom, _ = reader.conform_axis(validAnom, modTotal, -3)
+                validClim, _ = reader.conform_axis(validClim, modTotal, -3)
+            out[ndma] = (validAnom, validClim)
+        return out
+
     @safe_runner
-    def run_member(model, member, MODCLIM, OBSCLIM):
+    def run_member(model, member, MODCLIMS, VALIDS):
         print(f'        {variable.name}, {model.name}, {member=}')
-        # skip if the file already exists
-        if not option.force:
+        # skip if the file already exists, the incremental mode keeps raw/BC in sync
+        if not option.force and not option.incremental:
             skipRaw, skipBC = _get_skips(dataDir, model, member, variable, ndmas)
         else:
             skipRaw = False
@@ -98,72 +170,299 @@ def _run_variable(cases, dataDir, variable, option):
             print('all output files already exists')
             return
 
-        # read model total
-        MODTOTAL = reader.read_mod_total(case.model, member, variable, case.model.numLeads)
-        if MODTOTAL is None:
-            print('[fatal] no model total data is read')
+        # incremental: start from the stored accumulators, subtract the initTimes that left
+        # the window and only read the new initTimes whose valid times are all covered by
+        # the obs, the others wait for the next run
+        sums = {}
+        initSums = {}
+        dims = {}
+        iInitsTodo = None
+        foldedInitTimes = []
+        if option.incremental:
+            iInitsTodo, droppedInitTimes, canFold = _get_todo_inits(dataDir, model, member, variable, ndmas)
+            if option.force: # start over from empty sums
+                iInitsTodo, droppedInitTimes, canFold = list(range(len(model.initTimes))), [], False
+            if canFold:
+                for key in _get_keys(model, ndmas):
+                    sums[key], dims[key] = _read_accumulator(dataDir, model, member, variable, key)
+                    for initTime in droppedInitTimes:
+                        sums[key] = stats.subtract_stats(
+                            sums[key], _read_init_stats(dataDir, model, member, variable, key, initTime)
+                        )
+                foldedInitTimes = [t for i, t in enumerate(model.initTimes) if i not in iInitsTodo]
+
+            numTodo = len(iInitsTodo)
+            iInitsTodo = [
+                i for i in iInitsTodo if model.initTimes[i] + model.numLeads - 1 <= obsTimeEnd
+            ]
+            print(f'        folding {len(iInitsTodo)} new initTimes into the accumulators'
+                  + f', {numTodo - len(iInitsTodo)} wait for the obs'
+                  + f', {len(droppedInitTimes)} left the window')
+
+        # read model total by chunks of initTimes, accumulate the stats for scores
+        iterModTotal = reader.iter_mod_total(
+            model, member, variable, model.numLeads, option.init_chunk_size, iInitsTodo
+        )
+        initTimesRead = []
+        for iInits, MODTOTAL in iterModTotal:
+            if MODTOTAL is None:
+                print('[fatal] no model total data is read')
+                return
+
+            initTimes = [model.initTimes[i] for i in iInits]
+            initTimesRead.extend(initTimes)
+            # shared obs products are read-only, only the model side is per member
+            valids = get_valids(VALIDS, iInits, MODTOTAL)
+            if variable.ndim == 4: # the levels of the valid obs are shared by all windows
+                _, MODTOTAL = reader.conform_axis(valids[ndmas[0]][0], MODTOTAL, -3)
+            modTotals = windows.running_means(MODTOTAL.vals, option.windows, axis=1)
+
+            for window, ndma in zip(option.windows, ndmas):
+                validAnom, validClim = valids[ndma]
+                modTotal = Data(modTotals.pop(window), MODTOTAL.dims)
+
+                if not skipRaw:
+                    modAnom = modTotal - validClim
+                    _add_stats(sums, initSums, (ndma, 'raw'), validAnom.vals, modAnom.vals, option)
+                    dims[(ndma, 'raw')] = modAnom.dims
+
+                if not skipBC and MODCLIMS is not None:
+                    modAnom = Data(modTotal.vals - MODCLIMS[ndma].vals[_to_slice(iInits)], modTotal.dims)
+                    _add_stats(sums, initSums, (ndma, 'BC'), validAnom.vals, modAnom.vals, option)
+                    dims[(ndma, 'BC')] = modAnom.dims
+
+            # incremental: the per-init stats of the chunk are kept to leave the window later
+            if option.incremental:
+                for key, initSum in initSums.items():
+                    initStats = {name: initSum[name][-1] for name in stats.STAT_NAMES}
+                    _save_init_stats(dataDir, model, member, variable, key, initStats, initTimes, dims[key])
+                    if not option.save_init_stats:
+                        [initSum[name].clear() for name in stats.STAT_NAMES]
+
+        save_member(model, member, sums, initSums, dims, initTimesRead, foldedInitTimes=foldedInitTimes)
+
+    def save_member(model, member, sums, initSums, dims, initTimesRead, ensSums=None, foldedInitTimes=None):
+        '''
+        - initTimesRead: the initTimes read in this run, the stats_init files only hold
+          these, so in the incremental mode they are the newly folded initTimes
+        - foldedInitTimes: the initTimes already in the accumulators before this run
+        '''
+        for (ndma, rawOrBC), sum_ in sums.items():
+            scores = stats.stats_to_scores(sum_)
+            if ensSums is not None:
+                scores.update(ensemble.ens_stats_to_scores(ensSums[(ndma, rawOrBC)]))
+            # the aggregates first, the scores file marks the output as finished
+            path = _get_output_path(dataDir, model, member, variable, rawOrBC, ndma, 'regions')
+            aggregate.save_aggregates(
+                path,
+                aggregate.cal_aggregates(scores, dims[(ndma, rawOrBC)], option.aggregate_regions),
+                option.aggregate_regions, dims[(ndma, rawOrBC)],
+            )
+            _save_output(dataDir, model, member, variable, dims[(ndma, rawOrBC)], scores, rawOrBC, ndma)
+            if option.save_stats:
+                path = _get_output_path(dataDir, model, member, variable, rawOrBC, ndma, 'stats')
+                stats.save_stats(path, sum_, _get_dim_struct(variable, dims[(ndma, rawOrBC)]))
+            if option.incremental:
+                initTimes = sorted([*(foldedInitTimes or []), *initTimesRead])
+                _save_accumulator(
+                    dataDir, model, member, variable, (ndma, rawOrBC), sum_, dims[(ndma, rawOrBC)], initTimes
+                )
+                # after the accumulator, so a crash never loses the stats it still holds
+                _remove_init_stats(dataDir, model, member, variable, (ndma, rawOrBC), initTimes)
+
+        if not option.save_init_stats:
             return
 
-        for ndma in ndmas:
-            obsAnom = copy.deepcopy(OBSANOM)
-            obsClim = copy.deepcopy(OBSCLIM)
-            modClim = copy.deepcopy(MODCLIM)
-            modTotal = copy.deepcopy(MODTOTAL)
-
-            # rearrange obs data to valid (time) -> (initTime, lead)
-            validAnom, modTotal = reader.obs_to_valid(obsAnom, modTotal, model.initTimes)
-            validClim, modTotal = reader.obs_to_valid(obsClim, modTotal, model.initTimes)
-
-            if ndma == '7dma':
-                validAnom.vals = pyt.ct.smooth(validAnom.vals, 7, 1)
-                validClim.vals = pyt.ct.smooth(validClim.vals, 7, 1)
-                modTotal.vals = pyt.ct.smooth(modTotal.vals, 7, 1)
-                if not skipBC and modClim is not None:
-                    modClim.vals = pyt.ct.smooth(modClim.vals, 7, 1)
-            elif ndma != '1day':
-                raise ValueError(f'what is {ndma=}????')
-
-            if not skipRaw:
-                modAnom = modTotal - validClim
-                scoresRaw = _cal_scores(validAnom.vals, modAnom.vals)
-                _save_output(dataDir, model, member, variable, modAnom.dims, scoresRaw, "raw", ndma)
-
-            if not skipBC and modClim is not None:
-                modAnom = modTotal - modClim
-                scoresBC = _cal_scores(validAnom.vals, modAnom.vals)
-                _save_output(dataDir, model, member, variable, modAnom.dims, scoresBC, "BC", ndma)
-
-
-    # loop over case and members
-    for case in cases:
-        # read model clim
-        if case.model.hasClim:
-            MODCLIM = reader.read_mod_clim(
-                case.model, 0, variable, case.model.numLeads, case.model.climYears
+        for (ndma, rawOrBC), initSum in initSums.items():
+            initSum = {name: np.concatenate(initSum[name], axis=0) for name in stats.STAT_NAMES}
+            path = _get_output_path(dataDir, model, member, variable, rawOrBC, ndma, 'stats_init')
+            stats.save_stats(
+                path, initSum, {'init': initTimesRead, **_get_dim_struct(variable, dims[(ndma, rawOrBC)])}
             )
-            if MODCLIM is None:
-                print('[fatal] no model clim data is read')
+
+    @safe_runner
+    def run_ensemble(model, MODCLIMS, VALIDS):
+        '''
+        score the members, the ensemble mean, spread and crps from one read of all members
+        '''
+        members = list(model.members)
+        ensMember = ensemble.get_ens_member(model)
+        print(f'        {variable.name}, {model.name}, ensemble of {len(members)} members')
+
+        skips = {}
+        for member in [*members, ensMember]:
+            if option.force:
+                skipRaw, skipBC = False, not model.hasClim
+            else:
+                skipRaw, skipBC = _get_skips(dataDir, model, member, variable, ndmas)
+            skips[member] = {'raw': skipRaw, 'BC': skipBC}
+
+        if all([skip['raw'] and skip['BC'] for skip in skips.values()]):
+            print('all output files already exists')
+            return
+
+        sums = {member: {} for member in skips}
+        initSums = {member: {} for member in skips}
+        ensSums = {}
+        dims = {}
+        initTimesRead = []
+
+        # read all members by chunks of initTimes, (initTime, member, lead, ...)
+        iterEnsTotal = reader.iter_mod_total(
+            model, members, variable, model.numLeads, option.init_chunk_size
+        )
+        for iInits, ENSTOTAL in iterEnsTotal:
+            if ENSTOTAL is None:
+                print('[fatal] no model total data is read')
                 return
 
-            # make sure the level are consistent to the observation's
+            initTimes = [model.initTimes[i] for i in iInits]
+            initTimesRead.extend(initTimes)
+            valids = get_valids(VALIDS, iInits, Data(ENSTOTAL.vals[:, 0], ENSTOTAL.dims))
             if variable.ndim == 4:
-                MODCLIM, obsClim = reader.conform_axis(MODCLIM, OBSCLIM, axis=-3)
-            else:
-                obsClim = copy.copy(OBSCLIM)
-            MODCLIM.vals = pyt.ct.smooth(MODCLIM.vals, 7, 1)
-        else:
-            MODCLIM = None
-            obsClim = copy.copy(OBSCLIM)
+                _, ENSTOTAL = reader.conform_axis(valids[ndmas[0]][0], ENSTOTAL, -3)
+            ensTotals = windows.running_means(ENSTOTAL.vals, option.windows, axis=2)
+
+            for window, ndma in zip(option.windows, ndmas):
+                validAnom, validClim = valids[ndma]
+                ensTotal = ensTotals.pop(window)
+
+                clims = {'raw': validClim.vals}
+                if MODCLIMS is not None:
+                    clims['BC'] = MODCLIMS[ndma].vals[_to_slice(iInits)]
+
+                for rawOrBC, clim in clims.items():
+                    todo = [member for member in skips if not skips[member][rawOrBC]]
+                    if not todo:
+                        continue
+
+                    key = (ndma, rawOrBC)
+                    dims[key] = ENSTOTAL.dims
+                    ensAnom = ensTotal - clim[:, None]
+                    for iMember, member in enumerate(members):
+                        if member in todo:
+                            _add_stats(
+                                sums[member], initSums[member], key,
+                                validAnom.vals, ensAnom[:, iMember], option
+                            )
+
+                    if ensMember in todo:
+                        with warnings.catch_warnings():
+                            warnings.simplefilter('ignore', RuntimeWarning) # all-nan points
+                            ensMean = np.nanmean(ensAnom, axis=1)
+                        _add_stats(sums[ensMember], initSums[ensMember], key, validAnom.vals, ensMean, option)
+                        ensSums[key] = stats.merge_stats(
+                            [ensSums.get(key), ensemble.cal_ens_stats(validAnom.vals, ensAnom)],
+                            ensemble.ENS_STAT_NAMES,
+                        )
+
+        for member in skips:
+            save_member(
+                model, member, sums[member], initSums[member], dims, initTimesRead,
+                ensSums if member == ensMember else None,
+            )
+
+
+    # loop over case and members, the members run in parallel if num_workers > 1
+    numWorkers = option.num_workers
+    runTask = run_ensemble if option.ensemble else run_member
+    # the model clims are shared by groups of cases and released after each group,
+    # one case (its members in parallel) or numWorkers cases in the ensemble mode
+    groupSize = numWorkers if option.ensemble else 1
+    with parallel.SharedArrays() as sharedObs:
+        if numWorkers > 1: # the workers attach to the obs instead of copying them
+            OBSANOM = sharedObs.put(OBSANOM)
+            OBSCLIM = sharedObs.put(OBSCLIM)
+        OBSANOM.vals.flags.writeable = False
+
+        for iCase in range(0, len(cases), groupSize):
+            with parallel.SharedArrays() as shared:
+                tasks = []
+                for case in cases[iCase:iCase + groupSize]:
+                    # read model clim, the running means are taken once for all members
+                    if case.model.hasClim:
+                        MODCLIM = reader.read_mod_clim(
+                            case.model, 0, variable, case.model.numLeads, case.model.climYears
+                        )
+                        if MODCLIM is None:
+                            print('[fatal] no model clim data is read')
+                            return
+
+                        # make sure the level are consistent to the observation's
+                        if variable.ndim == 4:
+                            MODCLIM, obsClim = reader.conform_axis(MODCLIM, OBSCLIM, axis=-3)
+                        else:
+                            obsClim = OBSCLIM
+                        MODCLIM.vals = pyt.ct.smooth(MODCLIM.vals, 7, 1)
+                        MODCLIMS = {
+                            windows.get_window_name(window): Data(modClim, MODCLIM.dims)
+                            for window, modClim in windows.running_means(
+                                MODCLIM.vals, option.windows, axis=1
+                            ).items()
+                        }
+                    else:
+                        MODCLIMS = None
+                        obsClim = OBSCLIM
+
+                    iInit0, valids = build_valids(case.model, obsClim)
+                    if numWorkers > 1:
+                        if MODCLIMS is not None:
+                            MODCLIMS = {ndma: shared.put(modClim) for ndma, modClim in MODCLIMS.items()}
+                        # the views of the shared obs (window 1) are inherited as they are
+                        for ndma, pair in (valids or {}).items():
+                            valids[ndma] = tuple([
+                                valid if _is_view_of(valid.vals, [OBSANOM.vals, OBSCLIM.vals]) else shared.put(valid)
+                                for valid in pair
+                            ])
+                    VALIDS = (iInit0, valids)
+
+                    if option.ensemble: # all members at once, the cases run in parallel
+                        tasks.append((case.model, MODCLIMS, VALIDS))
+                    else:
+                        tasks.extend([
+                            (case.model, member, MODCLIMS, VALIDS) for member in case.model.members
+                        ])
+
+                parallel.run_tasks(runTask, tasks, numWorkers)
+                del tasks, MODCLIMS, VALIDS, valids
+
+
+def _get_boundary(option):
+    '''
+    the union of the regions to plot and aggregate, None for global
+    '''
+    if not option.subset_by_regions:
+        return None
+
+    regions = [*option.plot.regions, *option.aggregate_regions]
+    boundary = [
+        min([region.lonw for region in regions]),
+        max([region.lone for region in regions]),
+        min([region.lats for region in regions]),
+        max([region.latn for region in regions]),
+    ]
+    if boundary == [0, 360, -90, 90]:
+        return None
 
-        for member in case.model.members:
-            run_member(case.model, member, MODCLIM, obsClim)
+    print(f'         scores are calculated within {boundary=}')
+    return boundary
+
+
+def _get_members(model, option):
+    '''
+    the members with outputs, and the ensemble in the ensemble mode
+    '''
+    if option.ensemble:
+        return [*model.members, ensemble.get_ens_member(model)]
+    return list(model.members)
 
 
 def _get_skips(dataDir, model, member, variable, ndmas):
+    manifest = get_manifest(dataDir)
     skipRaw = True
     for ndma in ndmas:
         path = _get_output_path(dataDir, model, member, variable, "raw", ndma)
-        if not os.path.exists(path):
+        if not manifest.exists(path):
             skipRaw = False
 
     if not model.hasClim:
@@ -172,28 +471,152 @@ def _get_skips(dataDir, model, member, variable, ndmas):
         skipBC = True
         for ndma in ndmas:
             path = _get_output_path(dataDir, model, member, variable, "BC", ndma)
-            if not os.path.exists(path):
+            if not manifest.exists(path):
                 skipBC = False
 
     return skipRaw, skipBC
 
 
+def _is_view_of(vals, sharedVals):
+    return any([np.may_share_memory(vals, shared) for shared in sharedVals])
+
+
+def _to_slice(iInits):
+    # index by a slice (a view) when the initTimes are contiguous
+    if len(iInits) > 0 and np.all(np.diff(iInits) == 1):
+        return slice(iInits[0], iInits[-1] + 1)
+    return iInits
+
+
+def _get_keys(model, ndmas):
+    keys = [(ndma, 'raw') for ndma in ndmas]
+    if model.hasClim:
+        keys += [(ndma, 'BC') for ndma in ndmas]
+    return keys
+
+
+def _get_accumulator_path(dataDir, model, member, variable, key):
+    '''
+    the accumulator does not depend on initTime0, so it follows a rolling window
+    '''
+    ndma, rawOrBC = key
+    suffix = {'raw': 'raw', 'BC': 'bc'}[rawOrBC]
+    return f'{dataDir}/scores/{model.name}/E{member:03d}/incremental/{ndma}/{variable.name}_{suffix}_acc.nc'
+
+
+def _get_init_stats_path(dataDir, model, member, variable, key, initTime):
+    '''
+    the per-init stats of a folded initTime, subtracted when it leaves the window
+    '''
+    accDir = os.path.dirname(_get_accumulator_path(dataDir, model, member, variable, key))
+    suffix = {'raw': 'raw', 'BC': 'bc'}[key[1]]
+    return pyt.tt.float2format(initTime, f'{accDir}/init/%Y%m%d%H_{variable.name}_{suffix}.nc')
+
+
+def _get_todo_inits(dataDir, model, member, variable, ndmas):
+    '''
+    return the indices of model.initTimes not folded into the accumulators yet,
+    the folded initTimes that left the window (subtracted with their per-init stats),
+    and whether the accumulators can be folded into (otherwise start over)
+    '''
+    iInitsAll = list(range(len(model.initTimes)))
+    folded = None
+    for key in _get_keys(model, ndmas):
+        path = _get_accumulator_path(dataDir, model, member, variable, key)
+        if not os.path.exists(path):
+            return iInitsAll, [], False
+
+        initTimes = sorted([float(t) for t in pyt.nct.read(path, 'init')])
+        if folded is None:
+            folded = initTimes
+        elif folded != initTimes:
+            print(f'[warning] the accumulators are out of sync, recalculating ({path})')
+            return iInitsAll, [], False
+
+    if folded is None:
+        return iInitsAll, [], False
+
+    dropped = [t for t in folded if t not in model.initTimes]
+    for key in _get_keys(model, ndmas):
+        for initTime in dropped:
+            path = _get_init_stats_path(dataDir, model, member, variable, key, initTime)
+            if not os.path.exists(path):
+                print(f'[warning] the per-init stats are not found, recalculating ({path})')
+                return iInitsAll, [], False
+
+    return [i for i, t in enumerate(model.initTimes) if t not in folded], dropped, True
+
+
+def _read_accumulator(dataDir, model, member, variable, key):
+    path = _get_accumulator_path(dataDir, model, member, variable, key)
+    dimNames = ['lead', 'lev', 'lat', 'lon'] if variable.ndim == 4 else ['lead', 'lat', 'lon']
+    dims = [pyt.nct.read(path, dimName) for dimName in dimNames]
+    return stats.read_stats(path), dims
+
+
+def _save_accumulator(dataDir, model, member, variable, key, sum_, dims, foldedInitTimes):
+    '''
+    the stats and the folded initTimes are written at once to a temporary file,
+    then renamed over the old accumulator, so a crash never leaves a partial update
+    '''
+    path = _get_accumulator_path(dataDir, model, member, variable, key)
+    stats.save_stats(
+        path, sum_, {'init': foldedInitTimes, **_get_dim_struct(variable, dims)},
+        data={'folded': np.ones(len(foldedInitTimes))}, dimsOf={'folded': ['init']},
+    )
+
+
+def _read_init_stats(dataDir, model, member, variable, key, initTime):
+    return stats.read_stats(
+        _get_init_stats_path(dataDir, model, member, variable, key, initTime), iInits=slice(None)
+    )
+
+
+def _save_init_stats(dataDir, model, member, variable, key, initStats, initTimes, dims):
+    '''
+    initStats: the per-init stats (keepInits=True) of initTimes, one file per initTime
+    '''
+    for iInit, initTime in enumerate(initTimes):
+        path = _get_init_stats_path(dataDir, model, member, variable, key, initTime)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stats.save_stats(
+            path, {name: initStats[name][iInit:iInit+1] for name in stats.STAT_NAMES},
+            {'init': [initTime], **_get_dim_struct(variable, dims)},
+        )
+
+
+def _remove_init_stats(dataDir, model, member, variable, key, foldedInitTimes):
+    '''
+    remove the per-init stats of the initTimes not in the accumulator anymore
+    '''
+    keep = {_get_init_stats_path(dataDir, model, member, variable, key, t) for t in foldedInitTimes}
+    initDir = os.path.dirname(_get_init_stats_path(dataDir, model, member, variable, key, model.initTimes[0]))
+    if not os.path.isdir(initDir):
+        return
+
+    suffix = {'raw': 'raw', 'BC': 'bc'}[key[1]]
+    for fileName in os.listdir(initDir):
+        path = f'{initDir}/{fileName}'
+        if re.fullmatch(rf'\d{{10}}_{re.escape(variable.name)}_{suffix}\.nc', fileName) and path not in keep:
+            os.remove(path)
+
+
+def _add_stats(sums, initSums, key, o, f, option):
+    if not option.save_init_stats and not option.incremental:
+        sums[key] = stats.merge_stats([sums.get(key), stats.cal_stats(o, f)])
+        return
+
+    initStats = stats.cal_stats(o, f, keepInits=True)
+    sums[key] = stats.merge_stats([sums.get(key), stats.sum_init_stats(initStats, slice(None))])
+    if key not in initSums:
+        initSums[key] = {name: [] for name in stats.STAT_NAMES}
+    for name in stats.STAT_NAMES:
+        initSums[key][name].append(initStats[name])
+
+
 def _cal_scores(o, f):
-    o[(np.abs(o) > 1e10)] = np.nan
-    f[(np.abs(f) > 1e10)] = np.nan
-    bias = np.nanmean(o - f, axis=0)
-    rmse = np.sqrt(np.nanmean((o - f) ** 2, axis=0))
-    acc = np.nansum(f * o, axis=0) \
-        / np.sqrt(np.nansum(f ** 2, axis=0)) \
-        / np.sqrt(np.nansum(o ** 2, axis=0))
-
-    return {
-        'bias': bias,
-        'rmse': rmse,
-        'acc': acc,
-    }
+    return stats.stats_to_scores(stats.cal_stats(o, f))
 
-    
 
 def _create_output_dir(dataDir, model, member, ndma):
     scoresDir = f'{dataDir}/scores'
@@ -225,44 +648,54 @@ def _get_output_dir(dataDir, model, member, ndma):
         f'{scoresDir}/{model.name}/E{member:03d}/%y%m%d/{model.numInitTimes:04d}/{ndma}'
     )
 
-def _get_output_path(dataDir, model, member, variable, rawOrBC, ndma):
+def _get_output_path(dataDir, model, member, variable, rawOrBC, ndma, product=None):
+    '''
+    product: None for the scores, 'stats' or 'stats_init' for the sufficient statistics,
+             'regions' for the regional aggregates
+    '''
     if rawOrBC == 'raw':
         suffix = 'raw'
     elif rawOrBC == 'BC':
         suffix = 'bc'
     else:
         ValueError(f'unrecognized option {rawOrBC=}')
+    if product is not None:
+        suffix = f'{suffix}_{product}'
     outDir = _get_output_dir(dataDir, model, member, ndma)
     outPath = f'{outDir}/{variable.name}_{suffix}.nc'
     return outPath
 
 
-def _save_output(dataDir, model, member, variable, dims, scores, rawOrBC, ndma):
-    outPath = _get_output_path(dataDir, model, member, variable, rawOrBC, ndma)
-
+def _get_dim_struct(variable, dims):
     if variable.ndim == 4:
-        dimStruct = {
+        return {
             'lead': dims[-4],
             'lev': dims[-3],
             'lat': dims[-2],
             'lon': dims[-1],
         } 
     else:
-        dimStruct = {
+        return {
             'lead': dims[-3],
             'lat': dims[-2],
             'lon': dims[-1],
         } 
 
 
-    for scoreName, score in list(scores.items()):
-        pyt.nct.save(
-            outPath, {
-                scoreName: score,
-                **dimStruct
-            },
-            overwrite=True
-        )
+def _save_output(dataDir, model, member, variable, dims, scores, rawOrBC, ndma):
+    outPath = _get_output_path(dataDir, model, member, variable, rawOrBC, ndma)
+    dimStruct = _get_dim_struct(variable, dims)
+
+    # record the spatial extent, the scores may be calculated over a subset
+    boundary = [dims[-1][0], dims[-1][-1], dims[-2][0], dims[-2][-1]]
+    ncwriter.save(
+        outPath, scores, dimStruct,
+        attrs={'boundary': '_'.join([str(b) for b in boundary])},
+        chunks='series', # the plots read the regions over all leads
+    )
+    get_manifest(dataDir).record(
+        outPath, variable=variable.name, scores=list(scores), boundary=boundary
+    )
 
     print(f'saved to {outPath}')
 
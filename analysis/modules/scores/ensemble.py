@@ -0,0 +1,83 @@
+'''
+Sufficient statistics of the ensemble scores.
+
+All members of an init are scored as one (initTime, member, ...) block: the
+ensemble mean goes through stats.cal_stats like any member, and the spread
+and the fair CRPS are summed over the initTimes here, so no ensemble-mean
+file is written and the members are read only once.
+- spread: sqrt of the mean unbiased variance of the members
+- crps: the fair CRPS (Ferro 2014), from the sorted members in O(m log m)
+    mean_i |x_i - o| - sum_i (2i - m - 1) x_(i) / (m (m - 1))
+
+----
+ensStats = cal_ens_stats(o, fs)                          # sums over initTime
+ensStats = stats.merge_stats([ensStats1, ensStats2], ENS_STAT_NAMES)
+scores = ens_stats_to_scores(ensStats)                   # spread, crps
+'''
+import numpy as np
+from .stats import _iter_blocks
+
+
+ENS_STAT_NAMES = ['count_ens', 'sum_var', 'sum_crps']
+
+
+def get_ens_member(model):
+    '''
+    the member number of the ensemble outputs, E-21 for 21 members as post_proc/1-3_ensmean.py
+    '''
+    return -model.numMembers
+
+
+def cal_ens_stats(o, fs, blockSize=2**22):
+    '''
+    o: obs anomalies, (initTime, ...)
+    fs: member anomalies, (initTime, member, ...)
+    - only the points with o and all the members valid are counted
+    - values with |x| > 1e10 (and nans) are treated as missing
+    - the sums are accumulated in float64, block by block as stats.cal_stats
+    '''
+    if fs.shape[:1] + fs.shape[2:] != o.shape:
+        raise ValueError(f'fs must be o with a member axis, {o.shape=}, {fs.shape=}')
+
+    numMembers = fs.shape[1]
+    if numMembers < 2:
+        raise ValueError(f'at least 2 members are needed, {numMembers=}')
+
+    # the weights of the sorted members for the mean absolute difference between members
+    rank = np.arange(1, numMembers + 1, dtype=np.float64)
+    weights = (2 * rank - numMembers - 1) / (numMembers * (numMembers - 1))
+
+    outShape = o.shape[1:]
+    stats = {name: np.zeros(outShape, dtype=np.float64) for name in ENS_STAT_NAMES}
+    stats['count_ens'] = np.zeros(outShape, dtype=np.int32)
+
+    for block in _iter_blocks(o.shape, max(blockSize // numMembers, 1)):
+        ob = np.array(o[block], dtype=np.float64)
+        fb = np.array(fs[(block[0], slice(None), *block[1:])], dtype=np.float64)
+        valid = np.abs(ob) <= 1e10 # also false for nans
+        valid &= np.all(np.abs(fb) <= 1e10, axis=1)
+        ob[~valid] = 0
+        fb[np.broadcast_to(~valid[:, None], fb.shape)] = 0
+
+        out = block[1:]
+        stats['count_ens'][out] = np.count_nonzero(valid, axis=0)
+        stats['sum_var'][out] = np.sum(np.var(fb, axis=1, ddof=1), axis=0)
+
+        crps = np.mean(np.abs(fb - ob[:, None]), axis=1)
+        fb.sort(axis=1)
+        crps -= np.einsum('m,im...->i...', weights, fb)
+        stats['sum_crps'][out] = np.sum(crps, axis=0)
+
+    return stats
+
+
+def ens_stats_to_scores(stats):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(stats['count_ens'] > 0, stats['count_ens'], np.nan)
+        spread = np.sqrt(np.maximum(stats['sum_var'] / n, 0))
+        crps = stats['sum_crps'] / n
+
+    return {
+        'spread': spread,
+        'crps': crps,
+    }
@@ -18,6 +18,21 @@ class PathGetter():
             + f'{varName}_{BC_STATE(rawOrBc).value}.nc'
         )
 
+    def get_stats_path(self, modName, member, initTime, numInits, varName, ndma, rawOrBc, perInit=False):
+        product = 'stats_init' if perInit else 'stats'
+        return tt.float2format(
+            initTime,
+            f'{self.dataDir}/{self.subDir}/{modName}/E{member:03d}/%y%m%d/{numInits:04d}/{ndma}/'
+            + f'{varName}_{BC_STATE(rawOrBc).value}_{product}.nc'
+        )
+
+    def get_aggregates_path(self, modName, member, initTime, numInits, varName, ndma, rawOrBc):
+        return tt.float2format(
+            initTime,
+            f'{self.dataDir}/{self.subDir}/{modName}/E{member:03d}/%y%m%d/{numInits:04d}/{ndma}/'
+            + f'{varName}_{BC_STATE(rawOrBc).value}_regions.nc'
+        )
+
     def get_scoreCard_path(self, modName, member, initTime, numInits, rawOrBc):
         return tt.float2format(
             initTime,
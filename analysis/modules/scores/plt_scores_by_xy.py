@@ -1,73 +1,199 @@
 from .path import PathGetter
+from . import aggregate
+from . import windows
+from . import ensemble
+import parallel
+import numpy as np
 import os
+import matplotlib
+matplotlib.use('Agg') # don't start interactive plots, also in the forked workers
+from matplotlib import pyplot as plt
 from pytools import nctools as nct
-from pytools import caltools as ct
-import numpy as np
+
+
+SCORE_NAMES = ['bias', 'rmse', 'acc']
+
 
 def run(cases, dataDir, figDir, option):
+    '''
+    1. read each score file once for all the regions and levels
+    2. draw one figure for each variable, window, region and level
+    both run in option.plot_workers processes, a failed job does not stop the others
+    '''
+    numWorkers = option.plot_workers
+    regions = option.plot.regions
+
+    # ---- read jobs: one per file, shared by all the figures of the variable and window
+    readKeys, readArgs = [], []
+    for variable in option.variables:
+        for window in option.windows:
+            ndma = windows.get_window_name(window)
+            for iCase, case in enumerate(cases):
+                for member in _get_members(case.model, option):
+                    for rawOrBc in ['raw', 'bc']:
+                        if not case.model.hasClim and rawOrBc == 'bc':
+                            continue
+                        readKeys.append((variable.name, ndma, iCase, member, rawOrBc))
+                        readArgs.append((dataDir, case.model, member, variable, ndma, rawOrBc, regions))
+
+    tables, readFailures = _run_jobs('reading', _read_scores, readArgs, numWorkers)
+    tables = dict(zip(readKeys, tables))
+    failures = [readKeys[iJob] for iJob in readFailures]
+
+    # ---- figure jobs
+    figArgs = []
     for variable in option.variables:
+        levels = option.plot.levels if variable.ndim == 4 else [None]
+        for window in option.windows:
+            ndma = windows.get_window_name(window)
+            for iRegion, region in enumerate(regions):
+                for level in levels:
+                    lines = _get_lines(cases, tables, variable, ndma, iRegion, level)
+                    if not lines:
+                        continue
+
+                    levelName = '' if level is None else f'_{level}'
+                    figPath = f'{figDir}/scores_by_xy/{ndma}/{variable.name}{levelName}_{region.name}.png'
+                    levelTitle = '' if level is None else f' {level}hPa'
+                    title = f'{variable.name}{levelTitle} {ndma} {region.name} {region.boundary}'
+                    figArgs.append((figPath, title, lines))
 
-        if variable.ndim == 4:
-            levels = option.plot.levels
-        else:
-            levels = [None]
+    _, figFailures = _run_jobs('drawing', _draw, figArgs, numWorkers)
+    failures += [figArgs[iJob][0] for iJob in figFailures]
 
-        for region in option.plot.regions:
-            for level in levels:
-                _run_region(cases, dataDir, figDir, option, variable, level, region)
+    if failures:
+        print(f'[warning] {len(failures)} jobs failed:')
+        for failure in failures:
+            print(f'    {failure}')
 
 
-def _run_region(cases, dataDir, figDir, option, variable, level, region):
+def _run_jobs(name, func, argsList, numWorkers):
+    '''
+    return the results in the order of argsList and the failed jobs
+    '''
+    results = [None] * len(argsList)
+    failures = []
+    numJobs = len(argsList)
+    for iDone, (iJob, result, error) in enumerate(parallel.iter_tasks(func, argsList, numWorkers)):
+        results[iJob] = result
+        if error is not None:
+            failures.append(iJob)
+            print(f'[warning] {name} job {iJob} failed:\n{error}')
+        print(f'{name} {iDone+1}/{numJobs}', flush=True)
+    return results, failures
+
+
+def _read_scores(dataDir, model, member, variable, ndma, rawOrBc, regions):
+    '''
+    return {scoreName: {'mean', 'std', 'count': (region, [lev], lead)}}, levels, leads
+    or None if the scores are not found
+    '''
     pathGetter = PathGetter(dataDir)
 
-    # read score data -> [icase][imember][raw/bc]
-    print('reading..', flush=True)
-    scores = [None] * len(cases)
-    for iCase, case in enumerate(cases):
-        model = case.model
-        scores[iCase] = list([None] * len(case.model.members))
+    # the regional aggregates saved with the scores, if all the regions are there
+    aggregatesPath = pathGetter.get_aggregates_path(
+        model.name, member, model.initTime0, model.numInitTimes,
+        variable.name, ndma, rawOrBc
+    )
+    if os.path.exists(aggregatesPath):
+        out = aggregate.read_aggregates(aggregatesPath, SCORE_NAMES, regions)
+        if out is not None:
+            return out
 
-        for iMember, member in enumerate(case.model.members):
-            scores[iCase][iMember] = [None] * 2
+    path = pathGetter.get_scores_path(
+        model.name, member, model.initTime0, model.numInitTimes,
+        variable.name, ndma, rawOrBc
+    )
+    if not os.path.exists(path):
+        print(f'[warning] path not found: {path}')
+        return None
+
+    # read the bounding box of all the regions once, same reduction as the saved aggregates
+    w = min([region.lonw for region in regions])
+    e = max([region.lone for region in regions])
+    s = min([region.lats for region in regions])
+    n = max([region.latn for region in regions])
+    if variable.ndim == 3:
+        minMaxs = [[None]*2, [s, n], [w, e]]
+    elif variable.ndim == 4:
+        minMaxs = [[None]*2, [None]*2, [s, n], [w, e]]
+    else:
+        raise ValueError(f'cannot handle ndim={variable.ndim} (name={variable.name})')
+
+    table = {}
+    for scoreName in SCORE_NAMES:
+        data, dims = nct.ncreadByDimRange(path, scoreName, minMaxs, decodeTime=False)
+        if data is None:
+            print(f'[Error] unable to read {path}, {scoreName}')
+            return None
+        table.update(aggregate.cal_aggregates({scoreName: data}, dims, regions))
+
+    levels = dims[1] if variable.ndim == 4 else None
+    return table, levels, dims[0]
 
-            for iBc, rawOrBc in enumerate(['raw', 'bc']):
-                # should we read?
-                if not model.hasClim and rawOrBc == 'bc':
-                    continue
 
-                path = pathGetter.get_scores_path(
-                    model.name, member, model.initTime0, model.numInitTimes,
-                    variable.name, rawOrBc
-                )
-                
-                if not os.path.exists(path):
-                    print(f'[warning] path not found: {path}')
+def _get_lines(cases, tables, variable, ndma, iRegion, level):
+    '''
+    return [(label, leads, {scoreName: (mean, std)})] of the region and level
+    '''
+    lines = []
+    for iCase, case in enumerate(cases):
+        for member in [*case.model.members, ensemble.get_ens_member(case.model)]:
+            for rawOrBc in ['raw', 'bc']:
+                out = tables.get((variable.name, ndma, iCase, member, rawOrBc))
+                if out is None:
                     continue
 
-                # yes, we should.
-                scoreNames = ['bias', 'rmse', 'acc']
-                scores[iCase][iMember][iBc] = [None] * len(scoreNames)
-                if variable.ndim == 3:
-                    minMaxs = [[None]*2, region.boundary[-2:], region.boundary[:2]]
-                elif variable.ndim == 4:
-                    minMaxs = [[None]*2, [level, level], region.boundary[-2:], region.boundary[:2]]
+                table, levels, leads = out
+                if level is None:
+                    index = (iRegion,)
+                elif level in list(levels):
+                    index = (iRegion, list(levels).index(level))
                 else:
-                    raise ValueError(f'cannot handle ndim={variable.ndim} (name={variable.name})')
-                
-                for iScore, scoreName in enumerate(scoreNames):
-                    data, dims = nct.ncreadByDimRange(
-                        path, scoreName, minMaxs, decodeTime=False
-                    )
-                    if data is None:
-                        print('[Error] unable to read {path}, {scoreName}')
-                        continue
+                    print(f'[warning] level {level} not found ({case.name}, {variable.name})')
+                    continue
+
+                label = f'{case.name} {_get_member_name(member)}'
+                if rawOrBc == 'bc':
+                    label += '(BC)'
+                lines.append((label, np.asarray(leads), {
+                    scoreName: (table[scoreName]['mean'][index], table[scoreName]['std'][index])
+                    for scoreName in SCORE_NAMES
+                }))
+    return lines
+
+
+def _get_members(model, option):
+    if option.ensemble:
+        return [*model.members, ensemble.get_ens_member(model)]
+    return list(model.members)
+
+
+def _get_member_name(member):
+    if member == 0:
+        return 'CTL'
+    elif member < 0:
+        return 'ENS'
+    return f'M{member:03d}'
+
 
-                    area = ct.lonlat2area(dims[-1], dims[-2])
-                    s_mean = np.nanmean(data * area, axis=(-1, -2)) / np.nanmean(area, axis=(-1, -2))
-                    s_std = np.nanstd(data * area, axis=(-1, -2)) / np.nanmean(area, axis=(-1, -2))
-                    scores[iCase][iMember][iBc][iScore] = {
-                        'mean': s_mean,
-                        'std': s_std,
-                    }
+def _draw(figPath, title, lines):
+    fig, axs = plt.subplots(len(SCORE_NAMES), 1, sharex=True, layout='constrained', figsize=(8, 9))
+    try:
+        for ax, scoreName in zip(axs, SCORE_NAMES):
+            for label, leads, scores in lines:
+                mean, std = scores[scoreName]
+                ax.plot(leads, mean, label=label)
+                ax.fill_between(leads, mean - std, mean + std, alpha=0.15)
+            ax.set_ylabel(scoreName)
+            ax.grid()
 
+        axs[0].set_title(title)
+        axs[0].legend()
+        axs[-1].set_xlabel('lead (days)')
 
+        os.makedirs(os.path.dirname(figPath), exist_ok=True)
+        fig.savefig(figPath)
+    finally:
+        plt.close(fig)
+    return figPath
@@ -0,0 +1,182 @@
+'''
+Sufficient statistics of the scores.
+
+The scores are derived from sums over the initTime axis, so the sums of
+any batches of initTimes can be added up and turned into the scores of
+their union without touching the fields again.
+
+----
+stats = cal_stats(o, f)                 # sums over axis 0 (initTime)
+stats = merge_stats([stats1, stats2])   # union of the batches
+stats = subtract_stats(stats, stats1)   # stats2 back
+scores = stats_to_scores(stats)         # bias, rmse, acc, acc_centered
+
+stats = merge_stats([read_stats(path) for path in paths]) # stored batches
+stats = read_stats(pathInit, iInits=slice(-30, None))    # last 30 inits
+'''
+import pytools as pyt
+import numpy as np
+import ncwriter
+
+
+# sum_ff_all, sum_oo_all: over all the valid f (o), not only the valid pairs, for acc
+STAT_NAMES = ['count', 'sum_f', 'sum_o', 'sum_ff', 'sum_oo', 'sum_fo', 'sum_ff_all', 'sum_oo_all']
+
+
+def cal_stats(o, f, keepInits=False, blockSize=2**22):
+    '''
+    o, f: obs and forecast anomalies, (initTime, ...)
+    - only the pairs with both o and f valid are counted, except sum_ff_all
+      and sum_oo_all, which sum f**2 (o**2) wherever f (o) is valid
+    - values with |x| > 1e10 (and nans) are treated as missing
+    - keepInits: return the per-init partial sums, (initTime, ...), instead
+    - the sums are always accumulated in float64, even for float32 inputs
+    - o and f are read block by block (about blockSize values, whole initTime
+      axis), so the temporaries stay small and the inputs are never modified
+    '''
+    if o.shape != f.shape:
+        raise ValueError(f'o and f must have the same shape, {o.shape=}, {f.shape=}')
+
+    outShape = o.shape if keepInits else o.shape[1:]
+    stats = {name: np.zeros(outShape, dtype=np.float64) for name in STAT_NAMES}
+    stats['count'] = np.zeros(outShape, dtype=np.int32)
+
+    for block in _iter_blocks(o.shape, blockSize):
+        ob = np.array(o[block], dtype=np.float64)
+        fb = np.array(f[block], dtype=np.float64)
+        validO = np.abs(ob) <= 1e10 # also false for nans
+        validF = np.abs(fb) <= 1e10
+        ob[~validO] = 0
+        fb[~validF] = 0
+
+        out = block if keepInits else block[1:]
+        if keepInits:
+            np.multiply(fb, fb, out=stats['sum_ff_all'][out])
+            np.multiply(ob, ob, out=stats['sum_oo_all'][out])
+        else:
+            stats['sum_ff_all'][out] = np.einsum('i...,i...->...', fb, fb)
+            stats['sum_oo_all'][out] = np.einsum('i...,i...->...', ob, ob)
+
+        valid = validO & validF
+        ob[~valid] = 0
+        fb[~valid] = 0
+
+        if keepInits:
+            stats['count'][out] = valid
+            stats['sum_f'][out] = fb
+            stats['sum_o'][out] = ob
+            np.multiply(fb, fb, out=stats['sum_ff'][out])
+            np.multiply(ob, ob, out=stats['sum_oo'][out])
+            np.multiply(fb, ob, out=stats['sum_fo'][out])
+        else:
+            stats['count'][out] = np.count_nonzero(valid, axis=0)
+            stats['sum_f'][out] = np.sum(fb, axis=0)
+            stats['sum_o'][out] = np.sum(ob, axis=0)
+            stats['sum_ff'][out] = np.einsum('i...,i...->...', fb, fb)
+            stats['sum_oo'][out] = np.einsum('i...,i...->...', ob, ob)
+            stats['sum_fo'][out] = np.einsum('i...,i...->...', fb, ob)
+
+    return stats
+
+
+def _iter_blocks(shape, blockSize):
+    '''
+    yield the index tuples that cover shape in blocks of about blockSize values,
+    keeping the whole axis 0 in every block (any strides, no reshape copies)
+    '''
+    # the trailing axes taken whole, and the axis to be sliced
+    size = shape[0] if len(shape) > 0 else 1
+    axis = len(shape) - 1
+    while axis >= 1 and size * shape[axis] <= blockSize:
+        size *= shape[axis]
+        axis -= 1
+
+    if axis < 1: # everything fits in one block
+        yield (slice(None),)
+        return
+
+    step = max(blockSize // size, 1)
+    for outer in np.ndindex(*shape[1:axis]):
+        for i0 in range(0, shape[axis], step):
+            yield (slice(None), *outer, slice(i0, i0 + step))
+
+
+def merge_stats(statsList, names=STAT_NAMES):
+    '''
+    add up the stats of several batches of initTimes (None are skipped)
+    - names: the stats to add, e.g., ensemble.ENS_STAT_NAMES
+    '''
+    statsList = [stats for stats in statsList if stats is not None]
+    if not statsList:
+        return None
+
+    merged = {name: np.array(statsList[0][name], copy=True) for name in names}
+    for stats in statsList[1:]:
+        for name in names:
+            merged[name] += stats[name]
+    return merged
+
+
+def subtract_stats(stats, other, names=STAT_NAMES):
+    '''
+    remove the batch of other from stats, e.g., the initTimes leaving a rolling window
+    '''
+    return {name: stats[name] - other[name] for name in names}
+
+
+def sum_init_stats(stats, iInits):
+    '''
+    sum the per-init stats (keepInits=True) over the initTimes of iInits
+    '''
+    return {name: np.sum(stats[name][iInits], axis=0) for name in STAT_NAMES}
+
+
+def stats_to_scores(stats):
+    '''
+    bias: mean(o - f)
+    rmse: sqrt(mean((o - f)**2))
+    acc: uncentered anomaly correlation, f**2 and o**2 summed over their own
+         valid points as the original _cal_scores
+    acc_centered: the correlation of the valid pairs after removing the mean of f and o
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(stats['count'] > 0, stats['count'], np.nan)
+        sum_f, sum_o = stats['sum_f'], stats['sum_o']
+        sum_ff, sum_oo, sum_fo = stats['sum_ff'], stats['sum_oo'], stats['sum_fo']
+
+        bias = (sum_o - sum_f) / n
+        mse = (sum_oo - 2 * sum_fo + sum_ff) / n
+        rmse = np.sqrt(np.maximum(mse, 0))
+        acc = sum_fo / np.sqrt(stats['sum_ff_all']) / np.sqrt(stats['sum_oo_all'])
+
+        cov = sum_fo - sum_f * sum_o / n
+        var_f = np.maximum(sum_ff - sum_f ** 2 / n, 0)
+        var_o = np.maximum(sum_oo - sum_o ** 2 / n, 0)
+        acc_centered = cov / np.sqrt(var_f) / np.sqrt(var_o)
+
+    return {
+        'bias': bias,
+        'rmse': rmse,
+        'acc': acc,
+        'acc_centered': acc_centered,
+    }
+
+
+def save_stats(path, stats, dimStruct, data=None, dimsOf=None):
+    '''
+    data, dimsOf: more variables to write in the same file (see ncwriter.save)
+    '''
+    ncwriter.save(
+        path, {**{name: stats[name] for name in STAT_NAMES}, **(data or {})},
+        dimStruct, dimsOf=dimsOf, chunks='map',
+    )
+
+
+def read_stats(path, iInits=None):
+    '''
+    iInits: for the per-init stats, sum over these initTimes
+    '''
+    stats = {name: pyt.nct.read(path, name) for name in STAT_NAMES}
+    if iInits is not None:
+        stats = sum_init_stats(stats, iInits)
+    return stats
@@ -71,12 +71,23 @@ class Option_Plot():
 class Option(): 
     do_data_1day: bool = True
     do_data_7dma: bool = True
+    windows: list = None # running-mean windows in days, e.g., [1, 3, 7, 14, 30], overrides do_data_*
     do_plot: bool = True
     force: bool = False
     plot: dict = None
     variables: list = None
     regrid_delta_x: float = 1
     regrid_delta_y: float = 1
+    init_chunk_size: int = None # read model data by chunks of initTimes, None = auto: all at once, or 1 initTime in the ensemble mode
+    dtype: str = 'float64' # 'float32' to halve the memory, sums are still done in float64
+    subset_by_regions: bool = True # only read and score the bounding box of plot.regions
+    save_stats: bool = True # save the sufficient statistics next to the scores, see stats.py
+    save_init_stats: bool = False # also save the per-init stats, which are as large as the model data (incremental: only the initTimes folded in this run)
+    incremental: bool = False # only score the initTimes not folded into the stored accumulators yet, the initTimes leaving a rolling window are subtracted
+    num_workers: int = 1 # number of processes to run the members in parallel
+    ensemble: bool = False # read all members at once, also score their mean, spread and crps (E-{numMembers})
+    plot_workers: int = None # number of processes to read and draw the figures, default to num_workers
+    aggregate_regions: dict = None # {name: [w, e, s, n]} for the regional aggregates, default to plot.regions
     
     def __post_init__(self):
         if self.variables is None:
@@ -117,17 +128,55 @@ class Option():
         # check types
         checkType(self.do_data_1day, bool , 'do_data_1day')
         checkType(self.do_data_7dma, bool , 'do_data_7dma')
+        checkType(self.windows, [list, None], 'windows')
         checkType(self.do_plot, bool , 'do_plot')
         checkType(self.variables, list, 'variables')
         checkType(self.force, bool , 'force')
         checkType(self.regrid_delta_x, [float, int], 'regrid_delta_x')
         checkType(self.regrid_delta_y, [float, int], 'regrid_delta_y')
+        checkType(self.init_chunk_size, [int, None], 'init_chunk_size')
+        checkType(self.subset_by_regions, bool, 'subset_by_regions')
+        checkType(self.save_stats, bool, 'save_stats')
+        checkType(self.save_init_stats, bool, 'save_init_stats')
+        checkType(self.incremental, bool, 'incremental')
+        checkType(self.ensemble, bool, 'ensemble')
+        if self.ensemble and self.incremental:
+            raise ValueError('the ensemble mode does not support incremental')
+        checkType(self.num_workers, int, 'num_workers')
+        if self.num_workers < 1:
+            raise ValueError(f'num_workers must be positive, {self.num_workers=}')
+        checkType(self.plot_workers, [int, None], 'plot_workers')
+        if self.plot_workers is None:
+            self.plot_workers = self.num_workers
+        if self.plot_workers < 1:
+            raise ValueError(f'plot_workers must be positive, {self.plot_workers=}')
+        checkType(self.dtype, str, 'dtype')
+        if self.dtype not in ['float32', 'float64']:
+            raise ValueError(f'dtype must be float32 or float64, {self.dtype=}')
+        if self.windows is None:
+            self.windows = [1] * self.do_data_1day + [7] * self.do_data_7dma
+        [checkType(window, int, 'window') for window in self.windows]
+        if any([window <= 0 for window in self.windows]):
+            raise ValueError(f'windows must be positive, {self.windows=}')
+        if len(set(self.windows)) != len(self.windows):
+            raise ValueError(f'duplicated windows, {self.windows=}')
+        if self.init_chunk_size is not None and self.init_chunk_size <= 0:
+            raise ValueError(f'init_chunk_size must be positive, {self.init_chunk_size=}')
+        if self.init_chunk_size is None and self.ensemble: # all the members of a chunk are read at once
+            self.init_chunk_size = 1
         checkType(self.plot, [dict, None], 'plot')
+        checkType(self.aggregate_regions, [dict, None], 'aggregate_regions')
         [checkType(variable, dict, 'variable') for variable in self.variables]
 
 
         # convert to the option class objects
         self.plot = Option_Plot(**self.plot)
+        if self.aggregate_regions is None:
+            self.aggregate_regions = self.plot.regions
+        else:
+            self.aggregate_regions = [
+                Region(name, boundary) for name, boundary in self.aggregate_regions.items()
+            ]
         self.variables = [Option_Variable(**variable) for variable in self.variables]
 
 
@@ -0,0 +1,96 @@
+'''
+Write all the variables of a product to a netcdf file in one open.
+
+pyt.nct.save writes one variable per call, so a file with n variables is
+opened and its metadata rewritten n times. Here the product is written once
+to a temporary file and renamed over the destination, so a reader never sees
+a partial file, with optional chunking and compression.
+- chunks: None (netcdf default), 'map' (one whole lat/lon map per chunk),
+          'series' (the whole first axis per chunk, lat/lon in tiles), or a tuple
+- zlib, complevel, shuffle: lossless compression
+- leastSignificantDigit: lossy quantization of the floats, e.g., 3 keeps 0.001
+
+----
+save(path, {'bias': bias, 'rmse': rmse}, {'lead': lead, 'lat': lat, 'lon': lon},
+     attrs={'boundary': '0_360_-90_90'}, chunks='series')
+'''
+import numpy as np
+import netCDF4
+import os
+
+
+def save(path, data, dims, dimsOf=None, attrs=None, varAttrs=None, chunks=None,
+         zlib=True, complevel=1, shuffle=True, leastSignificantDigit=None):
+    '''
+    data: {name: values}
+    dims: {dimName: values}, also written as the coordinate variables
+    dimsOf: {name: [dimNames]}, default to the last ndim dims of dims
+    attrs: global attributes
+    varAttrs: {name: {attribute: value}}, for the data or dim variables
+    '''
+    dimsOf = dimsOf or {}
+    varAttrs = varAttrs or {}
+    dimNames = list(dims)
+
+    outDir = os.path.dirname(path)
+    if outDir:
+        os.makedirs(outDir, exist_ok=True)
+    tmpPath = f'{path}.{os.getpid()}.tmp.nc'
+
+    try:
+        with netCDF4.Dataset(tmpPath, 'w', format='NETCDF4') as f:
+            for dimName, values in dims.items():
+                values = _to_nc(values)
+                f.createDimension(dimName, len(values))
+                f.createVariable(dimName, values.dtype, (dimName,))[:] = values
+
+            for name, values in data.items():
+                values = _to_nc(values)
+                varDims = dimsOf.get(name, dimNames[len(dimNames) - values.ndim:])
+                shape = tuple(len(f.dimensions[d]) for d in varDims)
+                if len(varDims) != values.ndim or shape != values.shape:
+                    raise ValueError(f'{name} is {values.shape}, but the dims {varDims} are {shape}')
+
+                isFloat = np.issubdtype(values.dtype, np.floating)
+                var = f.createVariable(
+                    name, values.dtype, varDims,
+                    zlib=zlib and values.ndim > 0, complevel=complevel, shuffle=shuffle,
+                    chunksizes=_get_chunks(chunks, values.shape),
+                    least_significant_digit=leastSignificantDigit if isFloat else None,
+                )
+                var[:] = values
+
+            for name, attributes in varAttrs.items():
+                for key, value in attributes.items():
+                    f.variables[name].setncattr(key, value)
+
+            for key, value in (attrs or {}).items():
+                f.setncattr(key, value)
+
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+def _to_nc(values):
+    values = np.asarray(values)
+    if values.dtype == bool: # no boolean type in netcdf
+        values = values.astype(np.int8)
+    return values
+
+
+def _get_chunks(chunks, shape, tile=32):
+    if chunks is None or len(shape) == 0 or 0 in shape:
+        return None
+
+    if chunks == 'map':
+        return (*[1] * (len(shape) - 2), *shape[-2:]) if len(shape) >= 2 else shape
+    elif chunks == 'series':
+        if len(shape) < 3:
+            return shape
+        return (shape[0], *[1] * (len(shape) - 3), min(shape[-2], tile), min(shape[-1], tile))
+    elif isinstance(chunks, (tuple, list)):
+        return tuple(min(c, s) for c, s in zip(chunks, shape))
+    else:
+        raise ValueError(f'unrecognized {chunks=}')
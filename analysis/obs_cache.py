@@ -0,0 +1,253 @@
+'''
+Process-wide observation cache.
+
+The subdrivers (scores, mjo, general_plot) read the same observations over
+and over within one driver.run. Here the data are kept in an in-memory LRU
+and in an npz cache on disk, keyed by (kind, variable, source, level, climYears, grid).
+A request for a time range is served by slicing any cached entry that
+covers it, so one read of a long range serves all the shorter ones.
+- an entry covers the range of the times actually read, a read that stops
+  short of the requested range (near-real-time data, the end of the files)
+  is kept in memory only and read again by the next run
+- the npz files older than maxAgeDays are ignored and removed, and the
+  oldest files are removed when the disk tier grows over maxDiskBytes
+
+----
+cache = get_obs_cache(f'{dataDir}/cache/obs')
+vals, dims = cache.get(key, timeRange, read_func)
+'''
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import glob
+import time
+import os
+
+
+_caches = {}
+
+
+def get_obs_cache(cacheDir=None):
+    '''
+    return the shared cache for cacheDir (None = memory only)
+    '''
+    if cacheDir not in _caches:
+        _caches[cacheDir] = ObsCache(cacheDir)
+    return _caches[cacheDir]
+
+
+def make_key(kind, variable, source=None, level=None, climYears=None, grid=None):
+    return repr((kind, variable, source, level, _to_tuple(climYears), grid))
+
+
+class _Entry():
+    def __init__(self, timeRange, vals, dims):
+        '''
+        timeRange: the range covered by the data, see _get_covered_range
+        '''
+        self.timeRange = [float(t) for t in timeRange]
+        self.vals = vals
+        self.dims = dims
+        self.vals.flags.writeable = False
+        self.nbytes = vals.nbytes
+
+    def covers(self, timeRange):
+        return self.timeRange[0] <= timeRange[0] and timeRange[1] <= self.timeRange[1]
+
+    def slice(self, timeRange, copy):
+        time = np.asarray(self.dims[0], dtype=float)
+        index = np.nonzero((timeRange[0] <= time) & (time <= timeRange[1]))[0]
+        if len(index) == 0:
+            raise ValueError(f'no data found in cache for {timeRange=}')
+
+        sel = slice(index[0], index[-1] + 1)
+        vals = self.vals[sel]
+        if copy:
+            vals = vals.copy()
+        dims = [np.array(time[sel]), *[np.array(d) for d in self.dims[1:]]]
+        return vals, dims
+
+
+class ObsCache():
+    '''
+    cacheDir: where the entries are saved on disk, None to keep in memory only
+    maxBytes: the size limit of the in-memory LRU
+    maxDiskBytes: the size limit of the npz files in cacheDir
+    maxAgeDays: the npz files older than this are read again from the source
+    '''
+    def __init__(self, cacheDir=None, maxBytes=8 * 1024**3, maxDiskBytes=32 * 1024**3, maxAgeDays=7):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.maxDiskBytes = maxDiskBytes
+        self.maxAgeDays = maxAgeDays
+        self.entries = OrderedDict() # (key, timeRange) -> _Entry
+        self.numBytes = 0
+
+
+    def get(self, key, timeRange, read_func, copy=False, persist=True):
+        '''
+        read_func() -> vals, dims, called only when no cached entry covers timeRange
+        - vals are read-only unless copy=True
+        - the returned dims are always new arrays
+        - persist: also save a new entry on disk (skip it for small one-off reads),
+          only if the data cover the whole timeRange
+        '''
+        entry = self._find(key, timeRange)
+
+        if entry is None:
+            entry = self._load(key, timeRange)
+
+        if entry is None:
+            vals, dims = read_func()
+            if vals is None:
+                return None, None
+            if len(dims[0]) == 0:
+                raise ValueError(f'no data found for {timeRange=}')
+
+            coveredRange = _get_covered_range(timeRange, dims[0])
+            entry = _Entry(coveredRange, np.asarray(vals), list(dims))
+            if persist and coveredRange == [float(t) for t in timeRange]:
+                self._dump(key, entry)
+
+        self._add(key, entry)
+        return entry.slice(timeRange, copy)
+
+
+    def clear(self):
+        self.entries.clear()
+        self.numBytes = 0
+
+
+    def _find(self, key, timeRange):
+        for entryKey, entry in self.entries.items():
+            if entryKey[0] == key and entry.covers(timeRange):
+                return entry
+        return None
+
+
+    def _add(self, key, entry):
+        entryKey = (key, tuple(entry.timeRange))
+        if entryKey in self.entries:
+            self.entries.move_to_end(entryKey)
+            return
+
+        self.entries[entryKey] = entry
+        self.numBytes += entry.nbytes
+        while self.numBytes > self.maxBytes and len(self.entries) > 1:
+            _, dropped = self.entries.popitem(last=False)
+            self.numBytes -= dropped.nbytes
+
+
+    def _get_cache_prefix(self, key):
+        return f'{self.cacheDir}/{hashlib.sha1(key.encode()).hexdigest()}'
+
+
+    def _load(self, key, timeRange):
+        if self.cacheDir is None:
+            return None
+
+        for path in glob.glob(f'{self._get_cache_prefix(key)}_*.npz'):
+            try:
+                t0, t1 = [float(t) for t in path[:-4].split('_')[-2:]]
+            except ValueError:
+                continue
+            if self._is_stale(path):
+                _remove(path)
+                continue
+            if not (t0 <= timeRange[0] and timeRange[1] <= t1):
+                continue
+
+            try:
+                with np.load(path) as f:
+                    if str(f['key']) != key:
+                        continue
+                    numDims = int(f['numDims'])
+                    vals = f['vals']
+                    dims = [f[f'dim{i}'] for i in range(numDims)]
+            except Exception:
+                print(f'[warning] unable to read the obs cache {path}, skipped')
+                continue
+
+            return _Entry([t0, t1], vals, dims)
+
+        return None
+
+
+    def _dump(self, key, entry):
+        if self.cacheDir is None:
+            return
+
+        t0, t1 = entry.timeRange
+        path = f'{self._get_cache_prefix(key)}_{t0:.6f}_{t1:.6f}.npz'
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            tmpPath = f'{path}.{os.getpid()}.tmp.npz'
+            np.savez(
+                tmpPath, key=key, vals=entry.vals, numDims=len(entry.dims),
+                **{f'dim{i}': np.asarray(d) for i, d in enumerate(entry.dims)},
+            )
+            os.replace(tmpPath, path)
+        except OSError:
+            print(f'[warning] unable to write the obs cache {path}')
+            return
+        self._evict()
+
+
+    def _is_stale(self, path):
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return True
+        return age > self.maxAgeDays * 86400
+
+
+    def _evict(self):
+        '''
+        remove the stale files, then the oldest ones until the disk tier fits in maxDiskBytes
+        '''
+        files = []
+        for entry in os.scandir(self.cacheDir):
+            if not entry.name.endswith('.npz') or '.tmp.' in entry.name:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        files.sort()
+        numBytes = sum([size for _, size, _ in files])
+        for mtime, size, path in files:
+            if numBytes <= self.maxDiskBytes and not self._is_stale(path):
+                break
+            _remove(path)
+            numBytes -= size
+
+
+def _get_covered_range(timeRange, times):
+    '''
+    the requested range if the data reach both of its ends (within one time step),
+    otherwise the range of the data, so a short read does not hide the missing times
+    '''
+    times = np.unique(np.asarray(times, dtype=float))
+    step = np.min(np.diff(times)) if len(times) > 1 else 1
+    t0 = float(timeRange[0]) if times[0] - step < timeRange[0] else float(times[0])
+    t1 = float(timeRange[1]) if times[-1] + step > timeRange[1] else float(times[-1])
+    return [t0, t1]
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _to_tuple(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return tuple(_to_tuple(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -0,0 +1,131 @@
+'''
+Process pools for the per-member loops.
+
+The large read-only inputs (e.g., the obs anomaly and climatology) are moved
+into shared memory before the pool is started. The workers are forked, so
+they inherit both the shared blocks and the task function (closures are
+fine), and nothing large is pickled. The results come back in the order of
+the tasks regardless of which worker finished first.
+
+----
+with SharedArrays() as shared:
+    obs = shared.put(obs)                   # Data, vals now in shared memory
+    results = run_tasks(func, argsList, numWorkers=8)
+
+for iTask, result, error in iter_tasks(func, argsList, numWorkers=8):
+    ...                                     # as they finish, error is the traceback
+'''
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+import traceback
+
+
+_tasks = {} # id -> the function to run in the forked workers
+
+
+class SharedArrays():
+    '''
+    own the shared memory blocks, which are released on exit
+    - put() returns a copy of the Data whose vals is a read-only view of a block
+    '''
+    def __init__(self):
+        self.blocks = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def put(self, data):
+        if data is None:
+            return None
+
+        vals = np.ascontiguousarray(data.vals)
+        block = shared_memory.SharedMemory(create=True, size=max(vals.nbytes, 1))
+        self.blocks.append(block)
+
+        sharedVals = np.ndarray(vals.shape, dtype=vals.dtype, buffer=block.buf)
+        sharedVals[...] = vals
+        sharedVals.flags.writeable = False
+        return type(data)(sharedVals, list(data.dims))
+
+
+    def close(self):
+        for block in self.blocks:
+            try:
+                block.close()
+            except BufferError: # still viewed, the memory is freed with the last view
+                pass
+            block.unlink()
+        self.blocks = []
+
+
+def run_tasks(func, argsList, numWorkers=None):
+    '''
+    return [func(*args) for args in argsList], run by numWorkers forked processes
+    - numWorkers: None or 1 to run in this process
+    '''
+    argsList = list(argsList)
+    if numWorkers is None or numWorkers <= 1 or len(argsList) <= 1:
+        return [func(*args) for args in argsList]
+
+    taskId = id(func)
+    _tasks[taskId] = func
+    try:
+        context = multiprocessing.get_context('fork')
+        numWorkers = min(numWorkers, len(argsList))
+        with ProcessPoolExecutor(numWorkers, mp_context=context) as executor:
+            futures = [executor.submit(_run_task, taskId, args) for args in argsList]
+            return [future.result() for future in futures]
+    finally:
+        del _tasks[taskId]
+
+
+def iter_tasks(func, argsList, numWorkers=None):
+    '''
+    yield iTask, func(*argsList[iTask]), error in the order the tasks finish
+    - a failed task yields a None result and its traceback as the error
+      instead of stopping the other tasks
+    - numWorkers: None or 1 to run in this process
+    '''
+    argsList = list(argsList)
+    if numWorkers is None or numWorkers <= 1 or len(argsList) <= 1:
+        for iTask, args in enumerate(argsList):
+            yield iTask, *_run_caught(func, args)
+        return
+
+    taskId = id(func)
+    _tasks[taskId] = func
+    try:
+        context = multiprocessing.get_context('fork')
+        numWorkers = min(numWorkers, len(argsList))
+        with ProcessPoolExecutor(numWorkers, mp_context=context) as executor:
+            futures = {
+                executor.submit(_run_task_caught, taskId, args): iTask
+                for iTask, args in enumerate(argsList)
+            }
+            for future in as_completed(futures):
+                yield futures[future], *future.result()
+    finally:
+        del _tasks[taskId]
+
+
+def _run_task(taskId, args):
+    return _tasks[taskId](*args)
+
+
+def _run_task_caught(taskId, args):
+    return _run_caught(_tasks[taskId], args)
+
+
+def _run_caught(func, args):
+    try:
+        return func(*args), None
+    except Exception:
+        return None, traceback.format_exc()
@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from regridder import Regridder
+from obs_cache import get_obs_cache, make_key
 import pytools as pyt
 import numpy as np
 import copy
@@ -15,19 +17,42 @@ class Data:
 class Reader:
     '''
     level: use hPa
-    lon, lat: global
+    lon, lat: global, or within boundary=[w, e, s, n] if specified
+    regrid_halo: degrees read outside the boundary so that the regridding at the edges is intact
+    regridCacheDir: where the regrid operators are cached, default to {dataDir}/cache/regrid
+    obsCacheDir: where the obs are cached (shared by all readers), default to {dataDir}/cache/obs
+    dtype: the data are kept in this precision from read on, e.g., 'float32'
     '''
 
 
     def __init__(self, dataDir, obsSubDir='obs', modSubDir='processed',
-                 regrid_delta_x=1, regrid_delta_y=1, modelDataType='global_daily_1p0'):
+                 regrid_delta_x=1, regrid_delta_y=1, modelDataType='global_daily_1p0',
+                 regridCacheDir=None, obsCacheDir=None, dtype='float64',
+                 boundary=None, regrid_halo=3):
         self.obsDir = f'{dataDir}/{obsSubDir}'
         self.modDir = f'{dataDir}/{modSubDir}'
         self.regrid_lon = np.r_[0:360:regrid_delta_x]
         self.regrid_lat = np.r_[-90:90+1:regrid_delta_y]
+        self.boundary = boundary
+        self.regrid_halo = regrid_halo
+        if boundary is not None:
+            w, e, s, n = boundary
+            self.regrid_lon = self.regrid_lon[(w <= self.regrid_lon) & (self.regrid_lon <= e)]
+            self.regrid_lat = self.regrid_lat[(s <= self.regrid_lat) & (self.regrid_lat <= n)]
         self.NX = len(self.regrid_lon)
         self.NY = len(self.regrid_lat)
         self.modelDataType = modelDataType
+        self.dtype = np.dtype(dtype)
+        if regridCacheDir is None:
+            regridCacheDir = f'{dataDir}/cache/regrid'
+        self.regridder = Regridder(self.regrid_lon, self.regrid_lat, regridCacheDir)
+        if obsCacheDir is None:
+            obsCacheDir = f'{dataDir}/cache/obs'
+        self.obsCache = get_obs_cache(obsCacheDir)
+        self.gridKey = (
+            self.obsDir, float(regrid_delta_x), float(regrid_delta_y), self.dtype.name,
+            None if boundary is None else tuple(float(b) for b in boundary),
+        )
 
 
     def get_valid_time_range(self, initTimes, numLeads):
@@ -35,46 +60,66 @@ class Reader:
 
 
     def read_obs_total(self, variable, timeRange, source=None):
-        minMaxs = self._get_glb_min_maxs(variable.ndim, timeRange)
-        data = Data()
-        data.vals, data.dims = pyt.rt.obsReader.total(variable.name, minMaxs, source)
-        data.dims[0] = np.floor(data.dims[0]) # set all time to floor
+        def read():
+            minMaxs = self._get_min_maxs(variable.ndim, timeRange)
+            data = Data()
+            data.vals, data.dims = pyt.rt.obsReader.total(variable.name, minMaxs, source)
+            data.dims[0] = np.floor(data.dims[0]) # set all time to floor
 
-        data = self._post_proc(data, variable)
-        return data
+            data = self._post_proc(data, variable)
+            return data.vals, data.dims
+
+        key = make_key('total', variable.name, source, grid=self.gridKey)
+        return Data(*self.obsCache.get(key, timeRange, read))
 
 
     def read_obs_clim(self, variable, timeRange, climYears=[2001, 2020], source=None):
-        minMaxs = self._get_glb_min_maxs(variable.ndim, timeRange)
-        data = Data()
-        data.vals, data.dims = pyt.rt.obsReader.clim(
-            variable.name, minMaxs, source, climYears=climYears
-        )
+        def read():
+            minMaxs = self._get_min_maxs(variable.ndim, timeRange)
+            data = Data()
+            data.vals, data.dims = pyt.rt.obsReader.clim(
+                variable.name, minMaxs, source, climYears=climYears
+            )
 
-        timeClim = list(data.dims[0])
-        timeRequest = np.r_[np.floor(timeRange[0]):np.floor(timeRange[1])+1]
-        iDayRequest = [pyt.tt.dayOfYear229(t) - 1 for t in timeRequest]
-        indClim = [timeClim.index(iday) for iday in iDayRequest]
+            timeClim = list(data.dims[0])
+            timeRequest = np.r_[np.floor(timeRange[0]):np.floor(timeRange[1])+1]
+            iDayRequest = [pyt.tt.dayOfYear229(t) - 1 for t in timeRequest]
+            indClim = [timeClim.index(iday) for iday in iDayRequest]
 
-        data.vals = data.vals[indClim, :]
-        data.dims[0] = timeRequest
+            data.vals = data.vals[indClim, :]
+            data.dims[0] = timeRequest
 
-        data = self._post_proc(data, variable)
-        return data
+            data = self._post_proc(data, variable)
+            return data.vals, data.dims
 
+        key = make_key('clim', variable.name, source, climYears=climYears, grid=self.gridKey)
+        timeRange = [np.floor(timeRange[0]), np.floor(timeRange[1])]
+        return Data(*self.obsCache.get(key, timeRange, read))
+
+
+    def obs_to_valid(self, obs, model, initTimes, asView=False):
+        '''
+        rearrange obs (time, ...) -> (initTime, lead, ...) in a single gather
+        - valid dates not found in obs are filled with nans
+        - asView: return a read-only strided view of obs.vals (no copy) when
+          obs is daily-continuous and initTimes are evenly spaced by whole days
+        '''
+        numLeads = model.vals.shape[1]
+        validTimes = np.asarray(initTimes, dtype=float)[:, None] + np.arange(numLeads)[None, :]
 
-    def obs_to_valid(self, obs, model, initTimes):
         valid = Data()
-        valid.vals = np.nan * np.ones((*model.vals.shape[:2], *obs.vals.shape[1:]))
-        obsTime = list(obs.dims[0])
-        for iInit in range(model.vals.shape[0]):
-            for iLead in range(model.vals.shape[1]):
-                validDate = initTimes[iInit] + iLead
-                index = obsTime.index(validDate)
-                # print(validDate)
-                # print(obsTime)
-                # exit()
-                valid.vals[iInit, iLead, :] = obs.vals[index, :]
+        valid.vals = None
+        if asView:
+            valid.vals = self._get_strided_view(obs, validTimes)
+
+        if valid.vals is None:
+            index, found = self._get_time_index(obs.dims[0], validTimes)
+            valid.vals = obs.vals[index] # (init, lead, ...)
+            if not np.all(found):
+                print(f'[warning] {np.sum(~found)} valid dates are not found in obs, filled with nans')
+                if not np.issubdtype(valid.vals.dtype, np.floating):
+                    valid.vals = valid.vals.astype(float)
+                valid.vals[~found] = np.nan
 
         valid.dims = obs.dims
 
@@ -89,28 +134,59 @@ class Reader:
 
 
     def read_mod_total(self, model, member, variable, numLeads):
-        minMaxs = self._get_glb_min_maxs(variable.ndim, [0, numLeads-0.01])
+        return self._read_mod_total(model, model.initTimes, member, variable, numLeads)
+
+
+    def iter_mod_total(self, model, member, variable, numLeads, chunkSize=None, iInitsTodo=None):
+        '''
+        yield (iInits, data) for chunks of model.initTimes to bound the memory usage
+        - iInits: the indices of model.initTimes in this chunk
+        - data: same as read_mod_total for these initTimes (None if not read)
+        - member: or a list of members, all read at once into (initTime, member, lead, ...)
+        - chunkSize: number of initTimes per chunk, None to read all at once
+        - iInitsTodo: only read these indices of model.initTimes, default to all
+        '''
+        if iInitsTodo is None:
+            iInitsTodo = range(len(model.initTimes))
+        iInitsTodo = np.asarray(iInitsTodo, dtype=int)
+
+        numInits = len(iInitsTodo)
+        if chunkSize is None:
+            chunkSize = max(numInits, 1)
+
+        for i0 in range(0, numInits, chunkSize):
+            iInits = iInitsTodo[i0:i0 + chunkSize]
+            yield iInits, self._read_mod_total(
+                model, [model.initTimes[i] for i in iInits], member, variable, numLeads
+            )
+
+
+    def _read_mod_total(self, model, initTimes, member, variable, numLeads):
+        minMaxs = self._get_min_maxs(variable.ndim, [0, numLeads-0.01])
         data = Data()
+        isEnsemble = isinstance(member, list)
         data.vals, data.dims = pyt.modelreader.readTotal.readTotal(
             model.name, self.modelDataType, variable.name, minMaxs,
-            model.initTimes, [member], rootDir=self.modDir
+            initTimes, member if isEnsemble else [member], rootDir=self.modDir
         )
         if data.vals is None:
             return None
-        data.vals = np.squeeze(data.vals, axis=1) # member
+        if not isEnsemble:
+            data.vals = np.squeeze(data.vals, axis=1) # member
         data.dims[0] = np.floor(data.dims[0]) # set all time to floor
 
         if variable.ndim == 4:
             data.dims[1] /= 100 # Pa -> hPa
 
         # padding nans for lead dimension
-        if data.vals.shape[1] < numLeads: # not enough lead (TGFS PW :(( )
-            print(f'[warning] data is padded by nans because expecting {numLeads=}, but only received {data.vals.shape[1]}')
-            delta = numLeads - data.vals.shape[1]
-            nanShape = (data.vals.shape[0], delta, *data.vals.shape[2:])
+        leadAxis = 2 if isEnsemble else 1
+        if data.vals.shape[leadAxis] < numLeads: # not enough lead (TGFS PW :(( )
+            print(f'[warning] data is padded by nans because expecting {numLeads=}, but only received {data.vals.shape[leadAxis]}')
+            delta = numLeads - data.vals.shape[leadAxis]
+            nanShape = (*data.vals.shape[:leadAxis], delta, *data.vals.shape[leadAxis+1:])
             data.vals = np.concatenate(
-                (data.vals, np.nan * np.ones((nanShape))),
-                axis = 1
+                (data.vals, np.full(nanShape, np.nan, dtype=data.vals.dtype)),
+                axis = leadAxis
             )
             data.dims[0] = np.concatenate(
                 (data.dims[0], np.nan * np.ones((delta))),
@@ -121,7 +197,7 @@ class Reader:
         return data
 
     def read_mod_clim(self, model, member, variable, numLeads, climYears):
-        minMaxs = self._get_glb_min_maxs(variable.ndim, [0, numLeads-0.01])
+        minMaxs = self._get_min_maxs(variable.ndim, [0, numLeads-0.01])
         data = Data()
         data.vals, data.dims = pyt.modelreader.readModelClim.readModelClim(
             model.name, self.modelDataType, variable.name, minMaxs,
@@ -140,8 +216,12 @@ class Reader:
 
 
     def conform_axis(self, data1, data2, axis):
-        out1 = Data(data1.vals, data1.dims)
-        out2 = Data(data2.vals, data2.dims)
+        '''
+        keep the shared values of axis in both data
+        - the inputs are not modified, and the values are not copied if already shared
+        '''
+        out1 = Data(data1.vals, list(data1.dims))
+        out2 = Data(data2.vals, list(data2.dims))
 
         # find the shared dimension values
         dim1 = list(out1.dims[axis])
@@ -153,12 +233,10 @@ class Reader:
         ind2 = [dim2.index(d) for d in dimShared]
 
         # extract the indices of each data
-        out1.vals = np.swapaxes(out1.vals, 0, axis)
-        out2.vals = np.swapaxes(out2.vals, 0, axis)
-        out1.vals = out1.vals[ind1, :]
-        out2.vals = out2.vals[ind2, :]
-        out1.vals = np.swapaxes(out1.vals, 0, axis)
-        out2.vals = np.swapaxes(out2.vals, 0, axis)
+        if ind1 != list(range(len(dim1))):
+            out1.vals = np.take(out1.vals, ind1, axis=axis)
+        if ind2 != list(range(len(dim2))):
+            out2.vals = np.take(out2.vals, ind2, axis=axis)
 
         # overwrite the dimension values
         out1.dims[axis] = dimShared
@@ -166,21 +244,81 @@ class Reader:
 
         return out1, out2
 
-    def _get_glb_min_maxs(self, ndim, time):
+    def _get_time_index(self, times, targets):
+        '''
+        look up the indices of targets in times through a sorted search
+        return index (0 where not found) and the found mask, both shaped like targets
+        '''
+        times = np.asarray(times, dtype=float)
+        targets = np.asarray(targets, dtype=float)
+        order = np.argsort(times, kind='stable')
+        timesSorted = times[order]
+
+        pos = np.searchsorted(timesSorted, targets)
+        pos = np.clip(pos, 0, len(times) - 1)
+        found = timesSorted[pos] == targets
+        index = np.where(found, order[pos], 0)
+        return index, found
+
+
+    def _get_strided_view(self, obs, validTimes):
+        '''
+        return obs.vals viewed as (init, lead, ...) without copying,
+        or None if the time axes are not regular enough for a strided view
+        '''
+        obsTime = np.asarray(obs.dims[0], dtype=float)
+        if len(obsTime) < 2 or np.any(np.diff(obsTime) != 1):
+            return None
+
+        steps = np.diff(validTimes[:, 0])
+        if len(steps) > 0 and (
+            np.any(steps != steps[0]) or steps[0] <= 0 or steps[0] % 1 != 0
+        ):
+            return None
+        step = int(steps[0]) if len(steps) > 0 else 1
+
+        i0 = validTimes[0, 0] - obsTime[0]
+        iLast = validTimes[-1, -1] - obsTime[0]
+        if i0 % 1 != 0 or i0 < 0 or iLast > len(obsTime) - 1:
+            return None
+
+        vals = obs.vals[int(i0):]
+        return np.lib.stride_tricks.as_strided(
+            vals,
+            shape=(*validTimes.shape, *vals.shape[1:]),
+            strides=(step * vals.strides[0], *vals.strides),
+            writeable=False,
+        )
+
+
+    def _get_min_maxs(self, ndim, time):
         minMaxs = [[None] *2 ] * ndim
         minMaxs[0] = time
+
+        if self.boundary is None:
+            return minMaxs
+
+        # read the boundary + halo, global axes are left as None
+        w, e, s, n = self.boundary
+        halo = self.regrid_halo
+        lonw, lone = max(w - halo, 0), min(e + halo, 360)
+        lats, latn = max(s - halo, -90), min(n + halo, 90)
+        if not (lonw == 0 and lone == 360):
+            minMaxs[-1] = [lonw, lone]
+        if not (lats == -90 and latn == 90):
+            minMaxs[-2] = [lats, latn]
         return minMaxs
 
 
     def _regrid_xy(self, data):
-        data.vals = pyt.ct.interp_1d(data.dims[-1], data.vals, self.regrid_lon, -1, True)
-        data.vals = pyt.ct.interp_1d(data.dims[-2], data.vals, self.regrid_lat, -2, True)
+        data.vals = self.regridder.regrid(data.vals, data.dims[-1], data.dims[-2])
         data.dims[-1] = copy.copy(self.regrid_lon)
         data.dims[-2] = copy.copy(self.regrid_lat)
         return data
 
 
     def _post_proc(self, data, variable):
+        data.vals = data.vals.astype(self.dtype, copy=False)
         data = self._regrid_xy(data)
 
         if variable.name == 'mslp': # fix the mslp value/units :((
@@ -0,0 +1,167 @@
+'''
+Cached linear regridding operators.
+
+The weights for a (source grid, target grid) pair are built once and kept
+in an in-memory LRU and, optionally, on disk. Each operator is a two-point
+stencil per target point (indices + weights), which is applied to all the
+leading axes at once with a gather. Missing values (nans) only affect the
+target points that actually use them, same as pyt.ct.interp_1d.
+'''
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import os
+
+
+class Operator1D():
+    '''
+    linear interpolation (with linear extrapolation) from src to dst
+    '''
+    def __init__(self, src, dst):
+        src = np.asarray(src, dtype=float)
+        dst = np.asarray(dst, dtype=float)
+
+        order = np.argsort(src, kind='stable')
+        srcSorted = src[order]
+
+        if len(src) == 1:
+            self.index0 = np.zeros(len(dst), dtype=int)
+            self.index1 = np.zeros(len(dst), dtype=int)
+            self.weight0 = np.ones(len(dst))
+            self.weight1 = np.zeros(len(dst))
+            return
+
+        # the left point of the bracketing interval, extrapolate at both ends
+        pos = np.searchsorted(srcSorted, dst, side='right') - 1
+        pos = np.clip(pos, 0, len(src) - 2)
+        x0, x1 = srcSorted[pos], srcSorted[pos + 1]
+        weight1 = (dst - x0) / (x1 - x0)
+        weight0 = 1 - weight1
+
+        index0 = order[pos]
+        index1 = order[pos + 1]
+
+        # exact hits only touch one source point, so a nan neighbor is not spread
+        hit0 = weight1 == 0
+        hit1 = weight0 == 0
+        index1[hit0] = index0[hit0]
+        index0[hit1] = index1[hit1]
+
+        self.index0, self.index1 = index0, index1
+        self.weight0, self.weight1 = weight0, weight1
+
+
+    def apply(self, vals, axis):
+        shape = [1] * vals.ndim
+        shape[axis] = -1
+        weight0 = self.weight0.astype(vals.dtype, copy=False).reshape(shape)
+        weight1 = self.weight1.astype(vals.dtype, copy=False).reshape(shape)
+        out = np.take(vals, self.index0, axis=axis) * weight0
+        out += np.take(vals, self.index1, axis=axis) * weight1
+        return out
+
+
+    def to_arrays(self):
+        return {
+            'index0': self.index0, 'index1': self.index1,
+            'weight0': self.weight0, 'weight1': self.weight1,
+        }
+
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        operator = cls.__new__(cls)
+        for key in ['index0', 'index1', 'weight0', 'weight1']:
+            setattr(operator, key, arrays[key])
+        return operator
+
+
+class Regridder():
+    '''
+    regrid the last two axes (lat, lon) to the target grid
+    - operators are shared by all instances in the process
+    - cacheDir: store the operators on disk as well, None to disable
+    '''
+    _operators = OrderedDict()
+    maxOperators = 64
+
+    def __init__(self, lon, lat, cacheDir=None):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.cacheDir = cacheDir
+
+
+    def regrid(self, vals, lon, lat):
+        if not _same_grid(lon, self.lon):
+            vals = self._get_operator(lon, self.lon).apply(vals, -1)
+        if not _same_grid(lat, self.lat):
+            vals = self._get_operator(lat, self.lat).apply(vals, -2)
+        return vals
+
+
+    def _get_operator(self, src, dst):
+        key = _get_key(src, dst)
+        operators = Regridder._operators
+
+        if key in operators:
+            operators.move_to_end(key)
+            return operators[key]
+
+        operator = self._load(key)
+        if operator is None:
+            operator = Operator1D(src, dst)
+            self._dump(key, operator)
+
+        operators[key] = operator
+        while len(operators) > Regridder.maxOperators:
+            operators.popitem(last=False)
+
+        return operator
+
+
+    def _get_cache_path(self, key):
+        return f'{self.cacheDir}/{key}.npz'
+
+
+    def _load(self, key):
+        if self.cacheDir is None:
+            return None
+
+        path = self._get_cache_path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as arrays:
+                return Operator1D.from_arrays(arrays)
+        except Exception:
+            print(f'[warning] unable to read the regrid cache {path}, rebuilding')
+            return None
+
+
+    def _dump(self, key, operator):
+        if self.cacheDir is None:
+            return
+
+        path = self._get_cache_path(key)
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            tmpPath = f'{path}.{os.getpid()}.tmp.npz'
+            np.savez(tmpPath, **operator.to_arrays())
+            os.replace(tmpPath, path)
+        except OSError:
+            print(f'[warning] unable to write the regrid cache {path}')
+
+
+def _same_grid(src, dst):
+    src = np.asarray(src, dtype=float)
+    return src.shape == dst.shape and np.allclose(src, dst, rtol=0, atol=1e-6)
+
+
+def _get_key(src, dst):
+    sha = hashlib.sha1()
+    for grid in [src, dst]:
+        grid = np.ascontiguousarray(grid, dtype=float)
+        sha.update(str(grid.shape).encode())
+        sha.update(grid.tobytes())
+    return sha.hexdigest()
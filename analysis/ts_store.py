@@ -0,0 +1,320 @@
+'''
+Appendable time-series store, one netcdf file per (source, variable).
+
+The MJO chain wrote one tiny file per (day or init, member, variable), so
+the file-system metadata cost more than the data itself. Here the slots are
+kept in one file with the unlimited dims (time, member, ...): a slot is
+written in place, the filled flags index the written slots, and a range of
+times of all members is read as one hyperslab.
+- time: the date or the init time of a slot, appended in any order
+- member: the member number of a slot, 0 for the obs
+- sampleDims: {dimName: values} of one slot, None for an unlimited axis
+  (e.g., lead), the shorter series are padded with nans and their lengths kept
+- one writer at a time: mode='a' takes an exclusive lock on {path}.lock
+  (flock), a second writer waits for it up to lockTimeout seconds, then
+  fails. readers do not lock. close the store (or use with) to flush the
+  slots and release the lock
+
+----
+with open_store(path, ['pc1', 'pc2'], {'lead': None}) as store:
+    if not store.has(initTime, member):
+        store.write(initTime, member, {'pc1': pc1, 'pc2': pc2})
+
+with open_store(path, mode='r') as store:
+    vals, filled = store.read(dates, 'olr', members=[0])          # (time, member, lon)
+    times, vals, filled = store.read_range([dateStart, dateEnd], 'olr')
+'''
+import numpy as np
+import netCDF4
+import fcntl
+import time
+import os
+
+
+_writing = set() # the stores opened for append in this process
+
+
+def open_store(path, varNames=None, sampleDims=None, mode='a', dtype='float64',
+               timeChunk=32, sampleChunk=64, lockTimeout=600):
+    '''
+    open the store, it is created with varNames and sampleDims if not found (mode='a')
+    - timeChunk, sampleChunk: chunk sizes of the time and of the unlimited sample axes
+    - lockTimeout: seconds to wait for another writer (mode='a')
+    '''
+    return TsStore(path, varNames, sampleDims, mode, dtype, timeChunk, sampleChunk, lockTimeout)
+
+
+class TsStore():
+    def __init__(self, path, varNames=None, sampleDims=None, mode='a', dtype='float64',
+                 timeChunk=32, sampleChunk=64, lockTimeout=600):
+        if mode not in ['r', 'a']:
+            raise ValueError(f'mode must be r or a, {mode=}')
+
+        self.path = path
+        self.lock = None
+        if not os.path.exists(path) and mode == 'r':
+            raise FileNotFoundError(f'store not found: {path}')
+
+        if mode == 'a':
+            self.lock = _lock(path, lockTimeout)
+
+        try:
+            if not os.path.exists(path):
+                if not varNames:
+                    raise ValueError(f'varNames are needed to create the store {path}')
+                _create(path, varNames, sampleDims or {}, dtype, timeChunk, sampleChunk)
+
+            self.f = netCDF4.Dataset(path, mode)
+        except BaseException:
+            self._unlock()
+            raise
+
+        self.f.set_auto_mask(False)
+        self.varNames = self.f.getncattr('ts_variables').split()
+        self.hasLength = 'length' in self.f.variables
+
+        # the index of the slots, kept in memory
+        self.timeValues = [float(t) for t in self.f.variables['time'][:]]
+        self.times = {_key(t): i for i, t in enumerate(self.timeValues)}
+        self.members = {int(m): i for i, m in enumerate(self.f.variables['member'][:])}
+        self.filled = np.array(self.f.variables['filled'][:], dtype=bool)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        if self.f.isopen():
+            self.f.close()
+        self._unlock()
+
+
+    def _unlock(self):
+        if self.lock is not None:
+            _writing.discard(os.path.abspath(self.path))
+            self.lock.close() # releases the flock
+            self.lock = None
+
+
+    def has(self, time, member=0):
+        iTime = self.times.get(_key(time))
+        iMember = self.members.get(int(member))
+        if iTime is None or iMember is None:
+            return False
+        return bool(self.filled[iTime, iMember])
+
+
+    def write(self, time, member, data):
+        '''
+        data: {varName: values of one slot}
+        '''
+        self.write_many([time], member, {name: np.asarray(values)[None] for name, values in data.items()})
+
+
+    def write_many(self, times, member, data):
+        '''
+        data: {varName: (time, ...)}, the new times in ascending order are written at once
+        '''
+        iTimes = np.array([self._get_time_slot(t) for t in times])
+        iMember = self._get_member_slot(member)
+        contiguous = len(iTimes) > 0 and np.all(np.diff(iTimes) == 1)
+        if contiguous:
+            targets = [slice(iTimes[0], iTimes[-1] + 1)]
+        else:
+            targets = list(iTimes)
+
+        length = 0
+        for name, values in data.items():
+            values = np.asarray(values)
+            if values.shape[0] != len(times):
+                raise ValueError(f'{name} has {values.shape[0]} slots but {len(times)} times')
+
+            var = self.f.variables[name]
+            parts = [values] if contiguous else list(values)
+            for target, part in zip(targets, parts):
+                if self.hasLength:
+                    n = part.shape[-var.ndim + 2]
+                    var[target, iMember, :n] = part
+                    length = max(length, n)
+                else:
+                    var[target, iMember] = part
+
+        if self.hasLength:
+            # clear the tail of a longer series written before
+            old = self.f.variables['length'][iTimes, iMember]
+            for iTime, n in zip(iTimes, old):
+                if n > length:
+                    for name in data:
+                        self.f.variables[name][iTime, iMember, length:n] = np.nan
+            self.f.variables['length'][iTimes, iMember] = length
+
+        self.f.variables['filled'][iTimes, iMember] = 1
+        self.filled[iTimes, iMember] = True
+
+
+    def read(self, times, varName, members=None):
+        '''
+        return vals (time, member, ...), filled (time, member), nans where not filled
+        - the bounding box of the slots is read as one hyperslab
+        - members: default to all the members in the store
+        '''
+        return self._read(self.f.variables[varName], times, members, np.nan)
+
+
+    def read_range(self, timeRange, varName, members=None):
+        '''
+        return times, vals (time, member, ...), filled (time, member) of the slots in timeRange
+        '''
+        times = sorted([t for t in self.timeValues if timeRange[0] <= t <= timeRange[1]])
+        vals, filled = self.read(times, varName, members)
+        return np.array(times), vals, filled
+
+
+    def read_lengths(self, times, members=None):
+        '''
+        return the lengths of the series along the unlimited sample axis, 0 where not filled
+        '''
+        if not self.hasLength:
+            raise ValueError(f'no unlimited sample axis in {self.path}')
+        lengths, _ = self._read(self.f.variables['length'], times, members, 0)
+        return lengths
+
+
+    def iter_filled(self):
+        '''
+        yield (time, member) of the filled slots
+        '''
+        members = list(self.members)
+        for iTime, iMember in zip(*np.nonzero(self.filled)):
+            yield self.timeValues[iTime], members[iMember]
+
+
+    def _read(self, var, times, members, fillValue):
+        members = list(self.members) if members is None else list(members)
+        vals = np.full((len(times), len(members), *var.shape[2:]), fillValue, dtype=var.dtype)
+        filled = np.zeros((len(times), len(members)), dtype=bool)
+
+        iTimes = np.array([self.times.get(_key(t), -1) for t in times], dtype=int)
+        iMembers = np.array([self.members.get(int(m), -1) for m in members], dtype=int)
+        outTimes, outMembers = np.nonzero(iTimes >= 0)[0], np.nonzero(iMembers >= 0)[0]
+        if len(outTimes) == 0 or len(outMembers) == 0:
+            return vals, filled
+
+        iTimes, iMembers = iTimes[outTimes], iMembers[outMembers]
+        t0, m0 = iTimes.min(), iMembers.min()
+        block = var[t0:iTimes.max()+1, m0:iMembers.max()+1]
+        vals[np.ix_(outTimes, outMembers)] = block[np.ix_(iTimes - t0, iMembers - m0)]
+        filled[np.ix_(outTimes, outMembers)] = self.filled[np.ix_(iTimes, iMembers)]
+        vals[~filled] = fillValue
+        return vals, filled
+
+
+    def _get_time_slot(self, time):
+        key = _key(time)
+        if key not in self.times:
+            iTime = len(self.timeValues)
+            self.f.variables['time'][iTime] = time
+            self.times[key] = iTime
+            self.timeValues.append(float(time))
+            self._grow_filled()
+        return self.times[key]
+
+
+    def _get_member_slot(self, member):
+        member = int(member)
+        if member not in self.members:
+            iMember = len(self.members)
+            self.f.variables['member'][iMember] = member
+            self.members[member] = iMember
+            self._grow_filled()
+        return self.members[member]
+
+
+    def _grow_filled(self):
+        shape = (len(self.timeValues), len(self.members))
+        if self.filled.shape != shape:
+            filled = np.zeros(shape, dtype=bool)
+            filled[:self.filled.shape[0], :self.filled.shape[1]] = self.filled
+            self.filled = filled
+
+
+def _lock(path, timeout):
+    '''
+    take the exclusive lock of the store, return the open lock file
+    '''
+    key = os.path.abspath(path)
+    if key in _writing: # flock does not block within a process, it would wait forever
+        raise RuntimeError(f'the store is already opened for writing in this process: {path}')
+
+    outDir = os.path.dirname(path)
+    if outDir:
+        os.makedirs(outDir, exist_ok=True)
+
+    lock = open(f'{path}.lock', 'a')
+    timeStart = time.time()
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            if time.time() - timeStart > timeout:
+                lock.close()
+                raise TimeoutError(f'another writer holds {path}.lock for more than {timeout} s')
+            time.sleep(1)
+
+    _writing.add(key)
+    return lock
+
+
+def _create(path, varNames, sampleDims, dtype, timeChunk, sampleChunk):
+    outDir = os.path.dirname(path)
+    if outDir:
+        os.makedirs(outDir, exist_ok=True)
+
+    # created in a temporary file, so a store is either complete or not there
+    tmpPath = f'{path}.{os.getpid()}.tmp.nc'
+    try:
+        with netCDF4.Dataset(tmpPath, 'w', format='NETCDF4') as f:
+            f.createDimension('time', None)
+            f.createDimension('member', None)
+            f.createVariable('time', 'f8', ('time',), chunksizes=(timeChunk,))
+            f.createVariable('member', 'i4', ('member',), chunksizes=(64,))
+            f.createVariable('filled', 'i1', ('time', 'member'), fill_value=0, chunksizes=(timeChunk, 1))
+
+            chunks = [timeChunk, 1]
+            for dimName, values in sampleDims.items():
+                if values is None:
+                    f.createDimension(dimName, None)
+                    chunks.append(sampleChunk)
+                else:
+                    f.createDimension(dimName, len(values))
+                    f.createVariable(dimName, np.asarray(values).dtype, (dimName,))[:] = values
+                    chunks.append(len(values))
+
+            hasLength = any([values is None for values in sampleDims.values()])
+            if hasLength:
+                if list(sampleDims.values())[0] is not None:
+                    raise ValueError(f'only the first sample dim can be unlimited, {list(sampleDims)=}')
+                f.createVariable('length', 'i4', ('time', 'member'), fill_value=0, chunksizes=(timeChunk, 1))
+
+            dims = ('time', 'member', *sampleDims)
+            for varName in varNames:
+                f.createVariable(
+                    varName, dtype, dims, fill_value=np.nan, chunksizes=tuple(chunks),
+                    zlib=True, complevel=1, shuffle=True,
+                )
+            f.setncattr('ts_variables', ' '.join(varNames))
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+def _key(time):
+    # the times are float days, matched to the minute
+    return round(float(time) * 1440)
@@ -4,6 +4,7 @@ from pytools import dmstools as dmst
 from pytools import nctools as nct
 from pytools import caltools as ct
 from pytools import checktools as chkt
+from manifest import get_manifest
 from dataclasses import dataclass
 import numpy as np
 import os
@@ -43,6 +44,7 @@ class Converter():
         for variable in self.variables:
             chkt.checkType(variable, Variable, 'variable in variables')
 
+        self.manifest = get_manifest(self.desDirRoot)
         self.core_funcs = {# mapping outputtype to functions
            'global_daily_1p0': global_daily_1p0,
            'qbud-16d': qbud_16d,
@@ -64,11 +66,12 @@ class Converter():
         for outputType in outputTypes:
             print(outputType)
             path = getDesPath(outputType)
-            if not os.path.exists(path):
+            if not self.manifest.exists(path):
                 allFound = False
             else:
                 print(f'skipping {outputType}', end='', flush=True)
                 notFounds.remove(outputType)
+                continue
 
             if not os.path.exists(os.path.dirname(path)):
                 os.system(f'mkdir -p $(dirname {path})')
@@ -115,11 +118,12 @@ class Converter():
 
         for outputType in outputTypes:
             desPath = getDesPath(outputType)
-            if os.path.exists(desPath):
+            if self.manifest.exists(desPath):
                 print(f'skip {outputType} for existing {desPath}')
                 continue
             func = self.core_funcs[outputType]
             func(self.initTime, desPath, lon, lat, data, variable)
+            self.manifest.record(desPath, variable=variable.name, outputType=outputType)
 
         print('finished.')
 
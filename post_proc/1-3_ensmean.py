@@ -1,8 +1,20 @@
 #!/nwpr/gfs/com120/.conda/envs/rd/bin/python
+'''
+ensemble mean (and spread) of the processed model data -> member -{numMembers}
+
+the members are read one at a time and accumulated (Welford), so the memory
+does not grow with the number of members. the output is the file of member 0
+with the data replaced by the ensemble mean, plus {varName}_std (ddof=1) and
+the optional quantiles {varName}_q{percent}. the quantiles need all members
+of a point, so they are read by blocks of leads instead.
+'''
 import pytools as pyt
+from manifest import get_manifest
+import parallel
 import numpy as np
+import netCDF4
+import shutil
 import os
-import traceback
 
 def main():
     for modelName, numMembers in [
@@ -16,6 +28,9 @@ def run(modelName, numMembers):
     # settings
     force = False
     data_dir = '../../data/processed'
+    numWorkers = 4 # (init, variable) jobs in parallel
+    quantiles = [] # e.g., [0.1, 0.5, 0.9]
+    numLeadsPerRead = 5 # leads read at once for the quantiles
 
     initTime0 = pyt.tt.ymd2float(2025, 1, 1)
     numInits = 90
@@ -33,64 +48,133 @@ def run(modelName, numMembers):
     # auto settings
     initTimes = [initTime0 + d for d in range(numInits)]
     members = list(range(numMembers))
+    manifest = get_manifest(data_dir)
 
 
     def run(initTime, varName):
-        # create dummy output path
         srcPath = get_path(data_dir, modelName, initTime, 0, dataType, varName)
         desPath = get_path(data_dir, modelName, initTime, -numMembers, dataType, varName)
-        tmpPath = './tmp.nc'
 
-
-        if os.path.exists(desPath) and not force:
+        if manifest.exists(desPath) and not force:
             print(f'output path already exists {desPath}')
             return
 
         desDir = os.path.dirname(desPath)
-        if not os.path.exists(desDir):
-            os.system(f'mkdir -p {desDir}')
-
+        os.makedirs(desDir, exist_ok=True)
         if not os.access(desDir, os.W_OK):
-            print(f'permission denied to write to {desDir}')
-            return
-
-        # let's write to tmpPath first. only copy the file to destination after complete success.
-        os.system(f'cp {srcPath} {tmpPath}')
-        if not os.path.exists(tmpPath):
-            print('failed to copy tmpfile')
-            return
+            raise PermissionError(f'permission denied to write to {desDir}')
 
         ndim = get_ndim(varName)
-        minMaxs = [[None]*2]*ndim
-
-        # read data
-        data, dims = pyt.modelreader.readTotal.readTotal(
-            modelName, dataType, varName, minMaxs, [initTime],
-            members, rootDir=data_dir,
-        )
-
-        if data is None:
-            print('[fatal] No data is read')
-            return
-
-        data = np.squeeze(data, axis=0)         # init time
-        dataEnsMean = np.nanmean(data, axis=0)  # ensemble
-
-        # write, copy tmp to des, delete tmp
-        pyt.nct.write(tmpPath, varName, dataEnsMean)
-        os.system(f'mv {tmpPath} {desPath}')
-    
-
-    # main loop
-    for initTime in initTimes:
-        print(pyt.tt.float2format(initTime), end='..')
-        for varName in varNames:
-            print(varName, end='..')
-            try:
-                run(initTime, varName)
-            except Exception:
-                traceback.print_exc()
-        print('')
+        def read_member(member, minMaxs=None):
+            minMaxs = minMaxs or [[None]*2]*ndim
+            data, _ = pyt.modelreader.readTotal.readTotal(
+                modelName, dataType, varName, minMaxs, [initTime],
+                [member], rootDir=data_dir,
+            )
+            if data is None:
+                raise FileNotFoundError(f'no data is read ({varName}, E{member:03d})')
+            return data[0, 0] # init time, member
+
+        # reduce the members one by one
+        count, mean, std = cal_ens_moments(read_member, members)
+        data = {varName: mean, f'{varName}_std': std}
+
+        if quantiles:
+            data.update(cal_ens_quantiles(
+                read_member, members, quantiles, mean.shape, numLeadsPerRead, varName
+            ))
+
+        # write a copy of member 0 to a temporary file, then rename it to the destination
+        write_like(srcPath, desPath, varName, data)
+        manifest.record(desPath, variable=varName, numMembers=numMembers, minCount=int(count.min()))
+        return desPath
+
+
+    # main loop, the (init, variable) jobs run in parallel
+    jobs = [(initTime, varName) for initTime in initTimes for varName in varNames]
+    failures = []
+    for iDone, (iJob, desPath, error) in enumerate(parallel.iter_tasks(run, jobs, numWorkers)):
+        initTime, varName = jobs[iJob]
+        print(f'{iDone+1}/{len(jobs)}', pyt.tt.float2format(initTime), varName, end='..')
+        if error is not None:
+            failures.append(jobs[iJob])
+            print(f'failed\n{error}')
+        else:
+            print('done' if desPath is not None else 'skipped')
+
+    if failures:
+        print(f'[warning] {len(failures)} jobs failed:')
+        for initTime, varName in failures:
+            print(f'    {pyt.tt.float2format(initTime)} {varName}')
+
+
+def cal_ens_moments(read_member, members, ddof=1):
+    '''
+    Welford's one-pass mean and standard deviation over the members, nans are skipped
+    return count, mean, std
+    '''
+    count, mean, m2 = None, None, None
+    for member in members:
+        x = np.asarray(read_member(member), dtype=np.float64)
+        if mean is None:
+            count = np.zeros(x.shape, dtype=np.int32)
+            mean = np.zeros(x.shape, dtype=np.float64)
+            m2 = np.zeros(x.shape, dtype=np.float64)
+
+        valid = ~np.isnan(x)
+        count += valid
+        delta = np.where(valid, x - mean, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean += np.where(valid, delta / count, 0)
+        m2 += np.where(valid, delta * (x - mean), 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(m2 / (count - ddof))
+    mean[count == 0] = np.nan
+    std[count <= ddof] = np.nan
+    return count, mean, std
+
+
+def cal_ens_quantiles(read_member, members, quantiles, shape, numLeadsPerRead, varName):
+    '''
+    the quantiles over the members, all members of a block of leads are read at once
+    - shape: (lead, ...) of a member
+    '''
+    out = {f'{varName}_q{round(q * 100):02d}': np.full(shape, np.nan) for q in quantiles}
+    for i0 in range(0, shape[0], numLeadsPerRead):
+        i1 = min(i0 + numLeadsPerRead, shape[0])
+        minMaxs = [[i0, i1 - 0.01], *[[None]*2]*(len(shape) - 1)]
+        block = np.stack([read_member(member, minMaxs) for member in members])
+        values = np.nanquantile(block, quantiles, axis=0)
+        for name, value in zip(out, values):
+            out[name][i0:i1] = value
+    return out
+
+
+def write_like(srcPath, desPath, varName, data):
+    '''
+    copy srcPath, replace varName and add the other variables of data with the same dimensions
+    - the added variables are float32, the packing (scale_factor, add_offset) of
+      varName would truncate the spread and is not copied
+    - a packed varName stays packed, the nans are written as its fill value
+    '''
+    tmpPath = f'{desPath}.{os.getpid()}.tmp.nc'
+    try:
+        shutil.copyfile(srcPath, tmpPath)
+        with netCDF4.Dataset(tmpPath, 'a') as f:
+            dimensions = f.variables[varName].dimensions
+            for name, values in data.items():
+                if name not in f.variables:
+                    f.createVariable(name, 'f4', dimensions, fill_value=np.nan, zlib=True, complevel=1)
+                var = f.variables[name]
+                values = values.reshape(var.shape)
+                if 'scale_factor' in var.ncattrs() or 'add_offset' in var.ncattrs():
+                    values = np.ma.masked_array(np.nan_to_num(values), np.isnan(values))
+                var[:] = values
+        os.replace(tmpPath, desPath)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
 
 
 def get_ndim(varName):
@@ -3,7 +3,9 @@ import numpy as np
 from pytools.modelreader.readTotal import readTotal as readModel
 from pytools.filetools import canBeWritten
 from pytools import timetools as tt
-from pytools import nctools as nct
+from manifest import get_manifest
+import ncwriter
+import parallel
 from calendar import isleap
 import os
 
@@ -27,21 +29,62 @@ def recfs():
             )
 
 def regeps():
-    for varName in ['mslp', 'olr', 'prec', 'pw', 'q', 't', 't2m', 'u', 'u10', 'v', 'v10', 'z']:
-        for iDay366 in range(31+29+1, 31+29+31+1):
-            for dataType in ['analysis', 'global_daily_1p0']:
-                if varName not in ['u', 'v', 'w', 't', 'q', 'z'] and dataType == 'analysis':
-                    continue
-                for climYear in [[2006, 2020]]:
-                    calAndSaveClim(
-                        modelName='re_GEPSv3_newCFSR',
-                        dataType=dataType,
-                        varName=varName,
-                        member=0,
-                        initDateAs366=iDay366,
-                        minMaxYear=climYear,
-                        forceUpdate=True
-                    )
+    buildClims(
+        modelName='re_GEPSv3_newCFSR',
+        dataTypes=['analysis', 'global_daily_1p0'],
+        varNames=['mslp', 'olr', 'prec', 'pw', 'q', 't', 't2m', 'u', 'u10', 'v', 'v10', 'z'],
+        member=0,
+        days366=range(31+29+1, 31+29+31+1),
+        minMaxYear=[2006, 2020],
+        forceUpdate=True,
+        numWorkers=4,
+    )
+
+
+def buildClims(
+    modelName,
+    dataTypes,
+    varNames,
+    member=0,
+    days366=range(1, 367),
+    minMaxYear=[2001, 2020],
+    forceUpdate=False,
+    numWorkers=4,
+):
+    '''
+    the daily climatologies of many days, variables and data types in one run
+    - the (variable, dataType) jobs run in parallel, the days of a job in order
+    - every init file is read once and added to the running sum and count of
+      its day of year, which is written as soon as its last year is added
+    - the written days are recorded in the manifest, so a restarted run
+      (forceUpdate=False) continues from the first unfinished day
+    - a day with an init that cannot be read is not written, so a restarted
+      run builds it again
+    '''
+    jobs = [
+        (varName, dataType)
+        for varName in varNames
+        for dataType in dataTypes
+        if not (dataType == 'analysis' and varName not in ['u', 'v', 'w', 't', 'q', 'z'])
+    ]
+
+    def run(varName, dataType):
+        for initDateAs366 in days366:
+            calAndSaveClim(
+                modelName, dataType, varName, member,
+                initDateAs366, minMaxYear, forceUpdate,
+            )
+
+    failures = []
+    for iDone, (iJob, _, error) in enumerate(parallel.iter_tasks(run, jobs, numWorkers)):
+        varName, dataType = jobs[iJob]
+        print(f'[{iDone+1}/{len(jobs)}] {varName} {dataType} ' + ('failed' if error else 'done'))
+        if error is not None:
+            failures.append(jobs[iJob])
+            print(error)
+
+    if failures:
+        print(f'[warning] {len(failures)} jobs failed: {failures}')
 
 
 def calAndSaveClim(
@@ -57,7 +100,8 @@ def calAndSaveClim(
     #
     # ---- input settings
     #
-    desdir = f'../processed/{modelName}/clim/E{member:03d}/1day/{varName}'
+    desroot = '../processed'
+    desdir = f'{desroot}/{modelName}/clim/E{member:03d}/1day/{varName}'
     __, month, day = tt.float2ymd(
         tt.ymd2float(2000, 1, 1) + initDateAs366 - 1
     )
@@ -77,14 +121,16 @@ def calAndSaveClim(
     #
     # ---- checking output status
     #
-    if not os.path.isdir(desdir):
-        os.system(f'mkdir -p {desdir}')
-
-    if os.path.isfile(desname) and not forceUpdate:
+    manifest = get_manifest(desroot)
+    if not forceUpdate and manifest.exists(desname):
         print(f' output file already exists, manually delete it to proceed:')
         print(f'   del {desname}')
+        print(f'   python manifest.py verify {desroot}')
         return
 
+    if not os.path.isdir(desdir):
+        os.makedirs(desdir, exist_ok=True)
+
     if not canBeWritten(desname):
         print(f' permission denied to write the file: {desname}')
         return
@@ -92,13 +138,10 @@ def calAndSaveClim(
     #
     # ---- dispay status
     #
-    print(f'{modelName=}')
-    print(f'{varName=}')
-    print(f'month/day = {month:02d}/{day:02d}')
-    print(f'{minMaxYear=}')
+    print(f'{modelName=}, {varName=}, {dataType=}, month/day = {month:02d}/{day:02d}, {minMaxYear=}')
 
     #
-    # ---- calculating
+    # ---- calculating, one init file at a time into the running sum and count
     #
     if dataType != 'analysis' and numDims == 3:
         minMaxs = [minMaxLead, minMaxY, minMaxX]
@@ -109,24 +152,46 @@ def calAndSaveClim(
     elif dataType == 'analysis' and numDims == 4:
         minMaxs = [[-np.inf, np.inf], minMaxY, minMaxX]
 
-    data, dims = readModel(
-        modelName=modelName,
-        dataType=dataType,
-        varName=varName,
-        minMaxs=minMaxs,
-        initTimes=initTimes,
-        members=[member],
-    )
+    sums, counts, dims = None, None, None
+    numInits = 0 # the inits added to the sums
+    for initTime in initTimes:
+        data, dimsRead = readModel(
+            modelName=modelName,
+            dataType=dataType,
+            varName=varName,
+            minMaxs=minMaxs,
+            initTimes=[initTime],
+            members=[member],
+        )
+        if data is None:
+            print(f'[warning] model reader failed, skipping {tt.float2format(initTime)}')
+            continue
+
+        data = data[0, 0]  # init time, member
+        if varName == 'w':
+            data[(np.abs(data)>1e2)] = np.nan
+
+        if sums is None:
+            sums = np.zeros(data.shape, dtype=np.float64)
+            counts = np.zeros(data.shape, dtype=np.int32)
+            dims, dtype = dimsRead, data.dtype
+        valid = ~np.isnan(data)
+        sums += np.where(valid, data, 0)
+        counts += valid
+        numInits += 1
 
-    if data is None:
+    if sums is None:
         print('[Fatal Error] model reader failed.')
         return
 
-    if varName == 'w':
-        data[(np.abs(data)>1e2)] = np.nan
-    
-    data = np.squeeze(data, axis=1)  # pop away the member dimension
-    data = np.nanmean(data, axis=0)  # mean over years
+    # not written (nor recorded), so a restarted run builds the day again
+    if numInits < len(initTimes):
+        print(f'[warning] only {numInits}/{len(initTimes)} inits are read, {desname} is not saved')
+        return
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        data = (sums / counts).astype(dtype)  # mean over years
+    data[counts == 0] = np.nan
 
     #
     # ---- saving
@@ -141,14 +206,14 @@ def calAndSaveClim(
     elif dataType == 'analysis' and numDims == 3:
         dimNames = ['lat', 'lon']
 
-    nct.save(
+    ncwriter.save(
         desname,
-        {
-            varName: data,
-            **{dimName: dim for dimName, dim in zip(dimNames, dims)}
-        },
-        overwrite=True
+        {varName: data},
+        {dimName: dim for dimName, dim in zip(dimNames, dims)},
+        attrs={'numInits': numInits},
+        chunks='map',
     )
+    manifest.record(desname, variable=varName, climYears=minMaxYear, numInits=numInits)
     return
 
 
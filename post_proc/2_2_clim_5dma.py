@@ -2,7 +2,8 @@
 import pytools.timetools as tt
 from pytools.modelreader.readModelClim import readModelClim
 from pytools.filetools import canBeWritten
-from pytools.nctools import save
+from manifest import get_manifest
+import ncwriter
 import os
 import numpy as np
 
@@ -17,15 +18,22 @@ def main():
          't2m', 'u10', 'v10', 'mslp', 'prec', 'olr',
          'u', 'v', 't', 'q', 'z',
     ]:
-        for iDay in range(31):
-            print(f'-- {varName=}, {iDay+1=}')
-            initTime = tt.ymd2float(2001, 1, 1) + iDay
-            run(model, member, dataType, varName, initTime, climYears)
+        print(f'-- {varName=}')
+        run(model, member, dataType, varName, climYears, windows=[5], days366=range(1, 32))
 
 
-def run(model, member, dataType, varName, initTime, climYears):
+def run(model, member, dataType, varName, climYears, windows=[5], days366=range(1, 367)):
+    '''
+    the NdMA climatologies of all windows from one read of each 1day climatology
+    - days366: the target days of the 366-day calendar (0229 is day 60),
+      the windows wrap across Dec 31 -> Jan 1
+    - the window of n days is centered (one more day ahead for even n)
+    - the window sums slide by adding the incoming day and subtracting the
+      outgoing one, a day is kept in memory until its last window is done
+    '''
+    desRoot = '/nwpr/gfs/com120/9_data/models/processed'
     def getPath(date, climType): return tt.float2format(
-        date, f'/nwpr/gfs/com120/9_data/models/processed/{model}/clim/'
+        date, f'{desRoot}/{model}/clim/'
         f'E{member:03d}/{climType}/{varName}/{dataType}_{varName}_'
         f'%m%d_{'_'.join([str(y) for y in climYears])}_{climType}.nc'
     )
@@ -37,60 +45,126 @@ def run(model, member, dataType, varName, initTime, climYears):
             return 4
         else:
             raise ValueError(f'unrecognized {varName=}')
+
+    def getDate(day366): # any leap year for the 366-day calendar
+        return tt.ymd2float(2000, 1, 1) + day366 - 1
+
+    def getWindowDays(day366, window):
+        return [
+            (day366 + delta - 1) % 366 + 1
+            for delta in range(-((window - 1) // 2), window // 2 + 1)
+        ]
+
     #
     # ---- input settings
     #
     numDims = getNumDims()
     minMaxs = [[-np.inf, np.inf]]*numDims
-    initTimes = [initTime + delta for delta in [-2, -1, 0, 1, 2]]
+    if any([window < 2 for window in windows]):
+        raise ValueError(f'the windows must be longer than 1 day, {windows=}')
 
     #
-    # ---- output settings
+    # ---- output settings, the (day, window) already done are skipped
     #
-    desPath = getPath(initTime, '5dma')
+    manifest = get_manifest(desRoot)
+    desPaths = {}
+    for day366 in days366:
+        for window in windows:
+            desPath = getPath(getDate(day366), f'{window}dma')
+            if manifest.exists(desPath):
+                print(f' output file already exists, manually delete it to proceed:')
+                print(f'   del {desPath}')
+                print(f'   python manifest.py verify {desRoot}')
+                continue
 
-    if os.path.isfile(desPath):
-        print(f' output file already exists, manually delete it to proceed:')
-        print(f'   del {desPath}')
-        return
+            if not os.path.exists(os.path.dirname(desPath)):
+                os.makedirs(os.path.dirname(desPath), exist_ok=True)
 
-    if not os.path.exists(os.path.dirname(desPath)):
-        os.system(f'mkdir -p {os.path.dirname(desPath)}')
+            if not canBeWritten(desPath):
+                print(f'permission denied to write to {desPath}')
+                continue
+            desPaths[(day366, window)] = desPath
 
-    if not canBeWritten(desPath):
-        print(f'permission denied to write to {desPath}')
+    if not desPaths:
         return
 
+    # a day is needed until the target after its last window, where it is subtracted
+    targets = [day366 for day366 in days366 if any([(day366, w) in desPaths for w in windows])]
+    lastUse = {}
+    for iTarget, day366 in enumerate(targets):
+        for window in windows:
+            for day in getWindowDays(day366, window):
+                lastUse[day] = iTarget + 1
+
     #
-    # ---- read data
+    # ---- read data, each 1day file once
     #
-    data, dims = readModelClim(
-        model,
-        dataType,
-        varName,
-        minMaxs,
-        initTimes,
-        [member],
-        climYears,
-        climType='1day',
-    )
-    data = np.squeeze(data, axis=1)  # pop away member
-    data = np.nanmean(data, 0)
+    cache = {}
+    dims = None
+    def read(day366):
+        nonlocal dims
+        if day366 not in cache:
+            data, dims = readModelClim(
+                model,
+                dataType,
+                varName,
+                minMaxs,
+                [getDate(day366)],
+                [member],
+                climYears,
+                climType='1day',
+            )
+            cache[day366] = data[0, 0]  # init time, member
+        return cache[day366]
+
+    def add(sums, counts, data, sign):
+        valid = ~np.isnan(data)
+        sums += sign * np.where(valid, data, 0)
+        counts += sign * valid
 
     #
-    # ---- save output
+    # ---- slide the windows, nans are skipped
     #
-    if numDims == 3:
-        dimNames = ['lead', 'lat', 'lon']
-    elif numDims == 4:
-        dimNames = ['lead', 'plev', 'lat', 'lon']
-    save(
-        desPath,
-        {
-            varName: data,
-            **{dimName: dimVal for dimName, dimVal in zip(dimNames, dims)}
-        }
-    )
+    states = {} # window -> (days, sums, counts)
+    for iTarget, day366 in enumerate(targets):
+        for window in windows:
+            days = getWindowDays(day366, window)
+            if window in states and states[window][0][1:] == days[:-1]: # the next day
+                daysPrev, sums, counts = states[window]
+                add(sums, counts, read(daysPrev[0]), -1)
+                add(sums, counts, read(days[-1]), 1)
+            else: # start over
+                sums = np.zeros(read(days[0]).shape, dtype=np.float64)
+                counts = np.zeros(sums.shape, dtype=np.int32)
+                for day in days:
+                    add(sums, counts, read(day), 1)
+            states[window] = (days, sums, counts)
+
+            if (day366, window) not in desPaths:
+                continue
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                data = (sums / counts).astype(read(day366).dtype)
+            data[counts == 0] = np.nan
+
+            #
+            # ---- save output
+            #
+            desPath = desPaths[(day366, window)]
+            if numDims == 3:
+                dimNames = ['lead', 'lat', 'lon']
+            elif numDims == 4:
+                dimNames = ['lead', 'plev', 'lat', 'lon']
+            ncwriter.save(
+                desPath,
+                {varName: data},
+                {dimName: dimVal for dimName, dimVal in zip(dimNames, dims)},
+                chunks='map',
+            )
+            manifest.record(desPath, variable=varName, climYears=climYears, window=window)
+
+        for day in [day for day in cache if lastUse[day] <= iTarget]:
+            del cache[day]
 
 
 if __name__ == '__main__':
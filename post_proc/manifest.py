@@ -0,0 +1 @@
+../analysis/manifest.py
\ No newline at end of file
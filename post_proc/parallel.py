@@ -0,0 +1 @@
+../analysis/parallel.py
\ No newline at end of file
@@ -7,5 +7,7 @@ ln -s /nwpr/gfs/com120/0_tools/pytools/ .
 
 cd $root/analysis/modules/mjo/rmm/
 rm rmmPhaseDiagram.py RMM_Tool.py
-ln -s ~/0_tools/MJO/RMM_WH04/rmmPhaseDiagram.py ~/0_tools/MJO/RMM_WH04/RMM_Tool.py .
+ln -s ~/0_tools/MJO/RMM_WH04/rmmPhaseDiagram.py .
+# the in-repo copy, it has the batched projection (project, pcs_from_projection)
+ln -s ../../../../standalone_modules/mjo/rmm/RMM_Tool.py .
 
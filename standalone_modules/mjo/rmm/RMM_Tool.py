@@ -2,7 +2,6 @@
 import xarray as xr
 import numpy as np
 import netCDF4 as nc
-from scipy.ndimage import uniform_filter1d
 import pytools.timetools as tt
 import pytools.readtools.readtools as rt
 import pytools.caltools as ct
@@ -170,30 +169,60 @@ class RMM_Tool:
       print('       pcs not calculated')
       return
 
-    # normalize
-    olr  = olr  / r.zavg_std_olr
-    u850 = u850 / r.zavg_std_u850
-    u200 = u200 / r.zavg_std_u200
+    r.pc1, r.pc2 = r.get_pcs_batch( olr, u850, u200, sub120)
+    return r.pc1, r.pc2
 
-    # concatenate 
-    cdata = np.concatenate( (olr, u850, u200), axis=1)
+  def get_pcs_batch( r, olr, u850, u200, sub120=True):
+    # input shape: [ ..., nt, nx], e.g., [ member, init, nt, nx]
+    # output pc1, pc2: [ ..., nt]
+    # the projection is linear, so the variables are projected first (one
+    # matmul each) and the previous 120-day mean is removed from the pcs
+    # instead of the 432 columns, same results as the single series
+    olr, u850, u200 = [ np.asarray( v, dtype=np.float64) for v in (olr, u850, u200)]
 
-    # remove pre 120d
-    cdata[ np.isnan( cdata)] = 0.0
+    # checks
+    ok, msg = True, ''
+    if olr.shape != u850.shape or olr.shape != u200.shape:
+      ok, msg = False, f'OLR, U850 and U200 have different shapes. {olr.shape}, {u850.shape}, {u200.shape}'
+    elif olr.ndim < 2:
+      ok, msg = False, 'OLR must be at least a 2d array'
+    elif sub120 and olr.shape[-2] <= 120:
+      ok, msg = False, 'NT must be larger than 120'
+    elif olr.shape[-1] != 144:
+      ok, msg = False, 'NX must be 144'
+    if not ok:
+      print('ERROR: ' + msg)
+      print('       pcs not calculated')
+      return None, None
+
+    return r.pcs_from_projection( r.project( olr, u850, u200), sub120)
+
+  def project( r, olr, u850, u200):
+    # input shape: [ ..., nt, nx], output: [ ..., nt, 2]
+    # the normalized (nans are zeros) fields on the eofs, step by step, so the
+    # steps projected separately can be concatenated, e.g., the obs history
+    # projected once and shared by all the model runs
+    eof = np.asarray( r.eof_obs[:2, :], dtype=np.float64).reshape( 2, 3, 144)
+    pcs = 0
+    for iv, (var, std) in enumerate( zip(
+      (olr, u850, u200), (r.zavg_std_olr, r.zavg_std_u850, r.zavg_std_u200)
+    )):
+      var = np.where( np.isnan( var), 0.0, var) / std
+      pcs = pcs + np.matmul( var, eof[:, iv, :].T)
+    return pcs
+
+  def pcs_from_projection( r, pcs, sub120=True):
+    # input shape: [ ..., nt, 2] from project, output pc1, pc2: [ ..., nt]
+    pcs = np.array( pcs, dtype=np.float64)
+
+    # remove pre 120d, the mean of [t-120, t] for t >= 120
     if sub120:
       nsmooth = 121
-      mavg = uniform_filter1d( cdata, nsmooth, axis=0, mode='nearest')
-      ts = int( (nsmooth-1)/2 )
-      cdata[nsmooth-1:,:] -= mavg[ts:-ts,:]
-
-    # get pc1 & pc2 
-    r.pc1 = np.dot( r.eof_obs[0,:], np.transpose(cdata))
-    r.pc2 = np.dot( r.eof_obs[1,:], np.transpose(cdata))
+      csum = np.cumsum( pcs, axis=-2)
+      csum = np.concatenate( ( np.zeros_like( csum[..., :1, :]), csum), axis=-2)
+      pcs[..., nsmooth-1:, :] -= ( csum[..., nsmooth:, :] - csum[..., :-nsmooth, :]) / nsmooth
 
-    r.pc1 /= r.std_pc1 
-    r.pc2 /= r.std_pc2
-
-    return r.pc1, r.pc2
+    return pcs[..., 0] / r.std_pc1, pcs[..., 1] / r.std_pc2
 
   # def phase_diagram(r):
   #   fig, ax = plt.subplots( figsize=(7,7))
@@ -0,0 +1 @@
+../../analysis/modules/scores/aggregate.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../analysis/ncwriter.py
\ No newline at end of file
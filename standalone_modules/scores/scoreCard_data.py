@@ -1,5 +1,6 @@
 #!/nwpr/gfs/com120/.conda/envs/rd/bin/python
 from path import PathGetter
+import aggregate
 import pytools as pyt
 import numpy as np
 from dataclasses import dataclass
@@ -167,11 +168,38 @@ def run(settings: Settings, model: Model) -> None:
                 ndma=ndma,
             )
 
-            if not os.path.exists(path):
-                print(f'file not found: {path}')
-                continue
+            aggregatesPath = pathGetter.get_aggregates_path(
+                initTime=settings.initTime0,
+                numInits=settings.numInitTimes,
+                modName=model.name,
+                member=model.member,
+                rawOrBc=model.rawOrBc,
+                varName=variable.name,
+                ndma=ndma,
+            )
 
+            std_data = None
             for iScore, scoreName in enumerate(settings.scoreNames):
+                # the scores not normalized by the clim std come from the aggregates
+                if scoreName not in ['bias', 'rmse'] and os.path.exists(aggregatesPath):
+                    aggregates = [
+                        aggregate.read_aggregate(
+                            aggregatesPath, scoreName, region.name, region.boundary, variable.level
+                        )
+                        for region in settings.regions
+                    ]
+                    if all([a is not None for a in aggregates]):
+                        for iRegion, (score_all, std_all, _) in enumerate(aggregates):
+                            scores[iScore, iRegion, iVariable, ileads:ileade] = \
+                                pick_leads(score_all, indices)
+                            stds[iScore, iRegion, iVariable, ileads:ileade] = \
+                                pick_leads(std_all, indices)
+                        continue
+
+                if not os.path.exists(path):
+                    print(f'file not found: {path}')
+                    continue
+
                 data, dims = pyt.nct.ncreadByDimRange(
                     path, scoreName, minMaxs, decodeTime=False
                 )
@@ -179,7 +207,7 @@ def run(settings: Settings, model: Model) -> None:
                 if data is None:
                     continue
 
-                if iScore == 0:
+                if std_data is None:
                     std_data, std_dims = read_clim_std(settings, variable, areaRead)
                     std_data = pyt.ct.interp_1d(
                         std_dims[-1], std_data, dims[-1], axis=-1, extrapolate=True,
@@ -207,17 +235,8 @@ def run(settings: Settings, model: Model) -> None:
                         / np.nanmean(coslat, axis=(-1, -2))
                     std_all = np.sqrt(std_all)
 
-                    score, std = [], []
-                    for index in indices:
-                        if index > len(score_all):
-                            score.append(np.nan)
-                            std.append(np.nan)
-                        else:
-                            score.append(score_all[index])
-                            std.append(std_all[index])
-
-                    scores[iScore, iRegion, iVariable, ileads:ileade] = score
-                    stds[iScore, iRegion, iVariable, ileads:ileade] = std
+                    scores[iScore, iRegion, iVariable, ileads:ileade] = pick_leads(score_all, indices)
+                    stds[iScore, iRegion, iVariable, ileads:ileade] = pick_leads(std_all, indices)
 
 
     print(f'saving to {outPath}..')
@@ -278,6 +297,16 @@ def run(settings: Settings, model: Model) -> None:
         )
                     
 
+def pick_leads(values, indices):
+    picked = []
+    for index in indices:
+        if index > len(values):
+            picked.append(np.nan)
+        else:
+            picked.append(values[index])
+    return picked
+
+
 def read_clim_std(settings: Settings, variable: Variable, areaRead):
     # set path
     root = '/nwpr/gfs/com120/9_data'